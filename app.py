@@ -1,8 +1,12 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, abort, stream_with_context, g
 from utils.query_parser import parse_query
-from utils.analysis import analyze_query, suggest_visualizations
-from utils.global_config import VARIABLES, ANALYSIS_TYPES, YEARS, VISUALIZATION_CAPTIONS
+from utils.global_config import VARIABLES, ANALYSIS_TYPES, YEARS, VISUALIZATION_CAPTIONS, MAX_QUERY_YEARS, VARIABLE_CODE_MAPPING, VARIABLE_GROUPS, ARTIFACT_MAX_AGE, METRICS_ENABLED, PRECOMPUTE_ENABLED
+from utils.artifacts import load_artifact, artifact_exists, externalize_visualizations
+from utils.zonal import list_regions, load_region, region_overlaps
+from utils import metrics
 import os
+import json
+import time
 import logging
 
 app = Flask(__name__)
@@ -10,9 +14,39 @@ app = Flask(__name__)
 # Path to the data directory
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
 
+# Description of the dataset passed to the summary prompt
+METADATA = {
+    "description": "Land cover classification data",
+    "source": "MODIS Terra/Aqua satellite imagery",
+    "processing_steps": [
+        "Data downloaded from NASA EarthData",
+        "Reprojected to WGS84 EPSG:4326",
+        "Processed to extract land cover type"
+    ],
+}
+
+# The analysis, tile and rendering modules pull in GDAL, Matplotlib, Folium and the
+# OpenAI client, so routes import them on first use; "/" and "/get_config" never load them
+
 # Set up logging for debugging
 logging.basicConfig(level=logging.INFO)
 
+
+if METRICS_ENABLED:
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request_duration(response):
+        # Streamed responses are timed until their headers are sent
+        metrics.observe(
+            "http_request_duration_seconds", time.perf_counter() - g.request_start,
+            endpoint=request.endpoint or "unknown",
+        )
+        return response
+
+
 @app.route("/")
 def index():
     """Render the homepage."""
@@ -25,58 +59,238 @@ def get_config():
     return jsonify({
         "variables": VARIABLES,
         "analysis_types": ANALYSIS_TYPES,
-        "years": YEARS
+        "years": YEARS,
+        "regions": [
+            {"value": name, "label": name.replace("_", " ").title()} for name in list_regions(DATA_DIR)
+        ],
     })
 
 
-@app.route("/chat", methods=["POST"])
-def chat():
-    """Handle chat queries and return analysis results."""
-    data = request.json
+def parse_chat_request(data):
+    """
+    Validate the chat form data and build the parsed query.
+
+    Args:
+        data (dict): JSON body of the request.
+
+    Returns:
+        tuple: (parsed query, None) or (None, validation message).
+    """
     # Extract form data
     intent = data.get("analysisType", "").lower()
     variables = data.get("variable", [])
     years = data.get("years", [])
     comments = data.get("comments", "")
+    region = data.get("region") or None
 
     # Validation
     if not intent:
-        return jsonify({"text": "Please select an analysis type."})
+        return None, "Please select an analysis type."
     if not variables:
-        return jsonify({"text": "Please select at least one variable."})
-    if not years or len(years) > 2:
-        return jsonify({"text": "Please select a year"})
-
-     # Prepare metadata
-    metadata = {
-        "description": "Land cover classification data",
-        "source": "MODIS Terra/Aqua satellite imagery",
-        "processing_steps": [
-            "Data downloaded from NASA EarthData",
-            "Reprojected to WGS84 EPSG:4326",
-            "Processed to extract land cover type"
-        ],
-    }
-
+        return None, "Please select at least one variable."
+    if not years or len(years) > MAX_QUERY_YEARS:
+        return None, "Please select a year"
+    if isinstance(region, str) and region not in list_regions(DATA_DIR):
+        return None, "Please select a valid region."
+    if region is not None and not isinstance(region, str) and not _valid_custom_region(region, years):
+        return None, "Please select a valid region."
 
     # Parse the query
     parsed_query = {
         "intent": intent,
         "variables": variables,
         "years": years,
-        "comments": comments
+        "comments": comments,
+        "region": region,
     }
-    
-    result = analyze_query(parsed_query, DATA_DIR, metadata)
+    return parsed_query, None
+
+
+def _valid_custom_region(region, years):
+    """Check that a GeoJSON region holds valid polygons that overlap the rasters."""
+    try:
+        loaded = load_region(region, DATA_DIR)
+    except ValueError:
+        return False
+    file_path = os.path.join(DATA_DIR, f"LC_Type1_{years[0]}.tif")
+    # A missing year is reported by the analysis itself
+    return not os.path.exists(file_path) or region_overlaps(loaded, file_path)
+
+
+def format_visualizations(visualizations, data):
+    """
+    Return the visualizations in the format the client asked for.
+
+    With "imageFormat": "url" every visualization is stored as a
+    content-addressed artifact and only its URL is returned; otherwise the
+    base64 strings are returned inline.
+
+    Args:
+        visualizations (dict): Visualization type -> base64 string.
+        data (dict): JSON body of the request.
+
+    Returns:
+        dict: Visualization type -> base64 string or artifact URL.
+    """
+    if data.get("imageFormat") == "url":
+        return externalize_visualizations(visualizations, DATA_DIR)
+    return visualizations
+
+
+@app.route("/chat", methods=["POST"])
+def chat():
+    """Handle chat queries and return analysis results."""
+    from utils.analysis import analyze_query
+
+    parsed_query, error = parse_chat_request(request.json)
+    if error:
+        return jsonify({"text": error})
+
+    result = analyze_query(parsed_query, DATA_DIR, METADATA)
 
     # Prepare response
     response = {
         "text": result['summary'],
-        "image": result['visualizations'],
+        "image": format_visualizations(result['visualizations'], request.json),
     }
 
     return jsonify(response)
 
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Handle chat queries as Server-Sent Events.
+
+    A "result" event carrying the visualizations and the computed statistics
+    is sent as soon as they are ready, followed by "token" events with the
+    summary text as the model generates it and a final "done" event.
+    """
+    from utils.analysis import get_analysis_result, stream_analysis_summary
+
+    parsed_query, error = parse_chat_request(request.json)
+    if error:
+        return jsonify({"text": error})
+
+    result = get_analysis_result(parsed_query, DATA_DIR)
+    image = format_visualizations(result["visualizations"], request.json)
+
+    def events():
+        yield _sse("result", {"image": image, "stats": _result_stats(result)})
+        for text in stream_analysis_summary(
+            result["data"], parsed_query["intent"], METADATA, parsed_query["variables"],
+            parsed_query["comments"], result["transitions"], result["trajectories"], result["stable"],
+        ):
+            yield _sse("token", {"text": text})
+        yield _sse("done", {})
+
+    response = Response(stream_with_context(events()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def _result_stats(result):
+    """
+    Return the JSON-safe numbers of an analysis result for the client.
+
+    Args:
+        result (dict): Output of get_analysis_result.
+
+    Returns:
+        dict: {"years": [{"year", "pixel_count", "area_km2"}], "transitions": {"years",
+               "variables", "matrix"} or None, "stable": {"pixel_count", "area_km2"} or None}.
+    """
+    transitions = result["transitions"]
+    return {
+        "years": [
+            {"year": entry["year"], "pixel_count": entry["pixel_count"], "area_km2": entry["area_km2"]}
+            for entry in result["data"].values()
+        ],
+        "transitions": None if transitions is None else {
+            "years": transitions["years"],
+            "variables": transitions["variables"],
+            "matrix": transitions["matrix"].tolist(),
+        },
+        "stable": result["stable"],
+    }
+
+
+def _sse(event, payload):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.route("/tiles/<int:year>/<variable>/<int:z>/<int:x>/<int:y>.png", methods=["GET"])
+def tiles(year, variable, z, x, y):
+    """Serve one XYZ map tile highlighting a land cover class."""
+    from utils.tiles import get_tile, tile_version
+
+    if year not in YEARS or (variable not in VARIABLE_CODE_MAPPING and variable not in VARIABLE_GROUPS):
+        abort(404)
+    try:
+        png = get_tile(year, variable, z, x, y, DATA_DIR)
+    except (FileNotFoundError, ValueError):
+        abort(404)
+
+    response = Response(png, mimetype="image/png")
+    # Only URLs naming the current raster version may be cached; the map always adds it
+    if request.args.get("v") == tile_version(year, DATA_DIR):
+        response.headers["Cache-Control"] = "public, max-age=86400"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/artifacts/<name>", methods=["GET"])
+def artifacts(name):
+    """Serve a content-addressed visualization artifact with long-lived cache headers."""
+    if not artifact_exists(name, DATA_DIR):
+        abort(404)
+    # Weak, as the gzip and identity bodies of an artifact share the tag
+    etag = name.split(".")[0]
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        try:
+            content, mimetype, encoding = load_artifact(
+                name, DATA_DIR, accept_gzip="gzip" in request.accept_encodings
+            )
+        except FileNotFoundError:
+            abort(404)
+        response = Response(content, mimetype=mimetype)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = f"public, max-age={ARTIFACT_MAX_AGE}, immutable"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Expose stage timings, request durations and cache statistics in Prometheus text format."""
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/precompute/status", methods=["GET"])
+def precompute_status():
+    """Report the progress of precomputing derived data for new or changed rasters."""
+    from utils.precompute import load_status
+
+    status = load_status(DATA_DIR)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+
 if __name__ == "__main__":
     logging.info("Starting Flask app...")
+    metrics.clear_directory()
+    # With debug=True the reloader's parent only watches files; the child serves requests
+    if PRECOMPUTE_ENABLED and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        from utils.precompute import start_watcher
+        start_watcher(DATA_DIR)
     app.run(debug=True, port=5000)
@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+import numpy as np
+import rasterio
+import app
+from utils import llm, analysis, visualization
+from utils.zonal import list_regions
+from utils.summary_cache import SummaryCache
+from utils.global_config import SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_BYTES
+from benchmarks.synthetic import make_dataset
+from benchmarks.stubs import StubLLMClient
+
+SHIPPED_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# Years generated for synthetic datasets; the first and last are compared
+BENCHMARK_YEARS = ["2011", "2020"]
+
+BENCHMARK_VARIABLE = "croplands"
+
+# Visualization types exercised one at a time through generate_visualizations
+VISUALIZATION_TYPES = ["bar_chart", "choropleth_map", "map", "change_map", "line_chart"]
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(dataset, case, func, iterations, setup=None):
+    """
+    Time repeated calls of func and summarize them.
+
+    The first call is reported separately as the cold latency; percentiles
+    and throughput use the remaining warm calls. Exceptions are recorded in
+    the result instead of aborting the run.
+
+    Args:
+        dataset (str): Dataset name.
+        case (str): Benchmark case name.
+        func (callable): Zero-argument function to time.
+        iterations (int): Number of calls, including the cold one.
+        setup (callable, optional): Zero-argument function run untimed before every call.
+
+    Returns:
+        dict: Latency statistics in milliseconds, throughput and peak RSS.
+    """
+    rss_before = peak_rss_mb()
+    timings = []
+    error = None
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            break
+        timings.append((time.perf_counter() - start) * 1000)
+
+    result = {"dataset": dataset, "case": case, "iterations": len(timings)}
+    if timings:
+        warm = np.array(timings[1:] or timings)
+        result.update({
+            "cold_ms": round(timings[0], 3),
+            "mean_ms": round(float(warm.mean()), 3),
+            "min_ms": round(float(warm.min()), 3),
+            "p50_ms": round(float(np.percentile(warm, 50)), 3),
+            "p90_ms": round(float(np.percentile(warm, 90)), 3),
+            "p99_ms": round(float(np.percentile(warm, 99)), 3),
+            "max_ms": round(float(warm.max()), 3),
+            "throughput_per_s": round(1000 * len(warm) / float(warm.sum()), 3),
+        })
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    result["peak_rss_growth_mb"] = round(result["peak_rss_mb"] - rss_before, 1)
+    if error:
+        result["error"] = error
+    print(_format_result(result), file=sys.stderr)
+    return result
+
+
+def run_dataset(name, data_dir, iterations):
+    """
+    Run every benchmark case against one data directory.
+
+    Args:
+        name (str): Dataset name used in the results.
+        data_dir (str): Directory with LC_Type1_<year>.tif files.
+        iterations (int): Calls per case.
+
+    Returns:
+        list: One result dict per case.
+    """
+    years = BENCHMARK_YEARS
+    query = {"intent": "change_detection", "variables": BENCHMARK_VARIABLE, "years": years, "comments": ""}
+    results = [measure(name, "read_raster_data", lambda: analysis.read_raster_data(BENCHMARK_VARIABLE, years, data_dir), iterations)]
+    regions = list_regions(data_dir)
+    if regions:
+        results.append(measure(
+            name, f"read_raster_data[{regions[0]}]",
+            lambda: analysis.read_raster_data(BENCHMARK_VARIABLE, years, data_dir, regions[0]), iterations,
+        ))
+
+    data = analysis.read_raster_data(BENCHMARK_VARIABLE, years, data_dir)
+    for viz in VISUALIZATION_TYPES:
+        results.append(measure(
+            name, f"generate_visualizations[{viz}]",
+            lambda viz=viz: visualization.generate_visualizations(query, data_dir, data, [viz]), iterations,
+        ))
+
+    tiles_enabled = visualization.MAP_TILES_ENABLED
+    try:
+        for mode, enabled in (("tiles", True), ("overlay", False)):
+            visualization.MAP_TILES_ENABLED = enabled
+            results.append(measure(
+                name, f"draw_map[{mode}]",
+                lambda: visualization.draw_map(BENCHMARK_VARIABLE, years, data_dir), iterations,
+            ))
+    finally:
+        visualization.MAP_TILES_ENABLED = tiles_enabled
+
+    # End to end through Flask; the uncached case clears the response cache before every call
+    app_data_dir = app.DATA_DIR
+    app.DATA_DIR = data_dir
+    try:
+        client = app.app.test_client()
+        for intent in ("spatial_distribution", "change_detection", "trend_analysis"):
+            body = {"analysisType": intent, "variable": BENCHMARK_VARIABLE, "years": years}
+            post = lambda body=body: _check(client.post("/chat", json=body))
+            results.append(measure(name, f"chat[{intent}]", post, iterations, setup=_clear_caches))
+            results.append(measure(name, f"chat[{intent},cached]", post, iterations))
+    finally:
+        app.DATA_DIR = app_data_dir
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis and rendering pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1024, 4096],
+                        help="Side lengths of the synthetic rasters to generate.")
+    parser.add_argument("--iterations", type=int, default=5, help="Calls per case, including the cold call.")
+    parser.add_argument("--no-shipped", action="store_true", help="Skip the shipped data directory.")
+    parser.add_argument("--work-dir", help="Directory for synthetic rasters (default: a temporary directory).")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    llm.set_llm_client(StubLLMClient())
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="landcover-bench-")
+    # Keep the stub's summaries out of the real summary cache
+    if analysis._summary_cache is not None:
+        analysis._summary_cache = SummaryCache(
+            os.path.join(work_dir, "summaries.sqlite3"), SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_BYTES
+        )
+
+    datasets = []
+    if not args.no_shipped and all(
+        os.path.exists(os.path.join(SHIPPED_DATA_DIR, f"LC_Type1_{year}.tif")) for year in BENCHMARK_YEARS
+    ):
+        datasets.append(("shipped", SHIPPED_DATA_DIR))
+    for size in args.sizes:
+        datasets.append((f"synthetic_{size}", make_dataset(work_dir, size, BENCHMARK_YEARS, region_dir=SHIPPED_DATA_DIR)))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "rasterio": rasterio.__version__,
+            "gdal": rasterio.__gdal_version__,
+        },
+        "iterations": args.iterations,
+        "datasets": [_describe_dataset(name, data_dir) for name, data_dir in datasets],
+        "results": [],
+    }
+    # The pipeline prints debug output; keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        for name, data_dir in datasets:
+            report["results"].extend(run_dataset(name, data_dir, args.iterations))
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def _clear_caches():
+    """Drop the cached statistics and summaries so the next /chat runs the whole pipeline."""
+    analysis._response_cache.clear()
+    if analysis._summary_cache is not None:
+        analysis._summary_cache.clear()
+
+
+def _check(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"/chat returned HTTP {response.status_code}")
+    return response
+
+
+def _describe_dataset(name, data_dir):
+    with rasterio.open(os.path.join(data_dir, f"LC_Type1_{BENCHMARK_YEARS[0]}.tif")) as src:
+        return {"name": name, "path": data_dir, "width": src.width, "height": src.height}
+
+
+def _format_result(result):
+    if "error" in result:
+        return f"{result['dataset']:<16} {result['case']:<44} error: {result['error']}"
+    return (f"{result['dataset']:<16} {result['case']:<44} cold {result['cold_ms']:>10.1f} ms"
+            f"  p50 {result['p50_ms']:>9.1f} ms  p99 {result['p99_ms']:>9.1f} ms"
+            f"  rss {result['peak_rss_mb']:>7.1f} MiB")
+
+
+if __name__ == "__main__":
+    # Usage: python -m benchmarks.run [--sizes 1024 4096] [--iterations 5] [--output report.json]
+    main()
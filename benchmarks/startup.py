@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter; prints the timings of one start as JSON
+PROBE = """
+import sys, json, time, importlib
+mode = sys.argv[1]
+start = time.perf_counter()
+import app
+timings = {"import_app_s": time.perf_counter() - start}
+if mode == "eager":
+    # Load everything at import time, as app.py did before imports were deferred
+    from utils.warmup import WARMUP_MODULES
+    for module in WARMUP_MODULES:
+        importlib.import_module(module)
+    timings["import_app_s"] = time.perf_counter() - start
+elif mode == "warm":
+    from utils.warmup import warm_up
+    warm_up(app.DATA_DIR)
+timings["ready_s"] = time.perf_counter() - start
+
+from utils import llm
+from benchmarks.stubs import StubLLMClient
+llm.set_llm_client(StubLLMClient())
+client = app.app.test_client()
+for name, request in (
+    ("first_config_s", lambda: client.get("/get_config")),
+    ("first_chat_s", lambda: client.post("/chat", json={
+        "analysisType": "spatial_distribution", "variable": "croplands", "years": ["2011"]})),
+):
+    request_start = time.perf_counter()
+    response = request()
+    assert response.status_code == 200, response.status_code
+    timings[name] = time.perf_counter() - request_start
+print(json.dumps(timings))
+"""
+
+MODES = {
+    "eager": "heavy modules imported with the app, as before",
+    "lazy": "heavy modules imported on first use",
+    "warm": "lazy imports followed by the pre-fork warm-up",
+}
+
+
+def run_probe(mode):
+    """
+    Start a fresh interpreter and time importing the app and serving its first requests.
+
+    Args:
+        mode (str): One of MODES.
+
+    Returns:
+        dict: Timings in seconds, including the whole process lifetime.
+    """
+    start = time.perf_counter()
+    # The stub's summaries must not land in the real summary cache
+    env = dict(os.environ, SUMMARY_CACHE_PATH=os.path.join(tempfile.gettempdir(), "landcover-startup-summaries.sqlite3"))
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE, mode], cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings["process_s"] = time.perf_counter() - start
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark worker startup time.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per mode.")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    # One untimed start fills the OS page cache and the on-disk indexes
+    run_probe("warm")
+
+    report = {"runs": args.runs, "modes": {}}
+    for mode, description in MODES.items():
+        runs = [run_probe(mode) for _ in range(args.runs)]
+        summary = {"description": description}
+        for metric in runs[0]:
+            values = np.array([run[metric] for run in runs])
+            summary[metric] = {
+                "p50": round(float(np.percentile(values, 50)), 4),
+                "min": round(float(values.min()), 4),
+                "max": round(float(values.max()), 4),
+            }
+        report["modes"][mode] = summary
+        print(f"{mode:<6} import {summary['import_app_s']['p50']:.3f}s  "
+              f"ready {summary['ready_s']['p50']:.3f}s  "
+              f"first /get_config {summary['first_config_s']['p50'] * 1000:.1f}ms  "
+              f"first /chat {summary['first_chat_s']['p50'] * 1000:.1f}ms", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    # Usage: python -m benchmarks.startup [--runs 5] [--output startup.json]
+    main()
@@ -0,0 +1,18 @@
+from types import SimpleNamespace
+
+STUB_SUMMARY = "Synthetic summary used for benchmarking."
+
+
+class StubLLMClient:
+    """Stand-in for openai.OpenAI that answers instantly with a fixed summary."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, stream=False, **kwargs):
+        if stream:
+            return iter([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+                for word in STUB_SUMMARY.split()
+            ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=STUB_SUMMARY))])
@@ -0,0 +1,94 @@
+import os
+import glob
+import shutil
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from utils.global_config import VARIABLE_CODE_MAPPING
+
+# MODIS sinusoidal grid of the shipped LC_Type1 files
+MODIS_CRS = CRS.from_proj4("+proj=sinu +lon_0=0 +x_0=0 +y_0=0 +R=6371007.181 +units=m +no_defs")
+PIXEL_SIZE = 463.312716527778
+ORIGIN = (-8727884.95395028, 535589.5003061113)
+
+# Pixels per side of the homogeneous patches the classes are drawn in
+PATCH_SIZE = 32
+
+# Share of patches reassigned to another class between consecutive years
+PATCH_CHANGE_RATE = 0.05
+
+# Share of pixels replaced by a random class, so files compress like real data
+PIXEL_NOISE_RATE = 0.02
+
+OVERVIEW_FACTORS = [2, 4, 8, 16]
+
+
+def make_dataset(root, size, years, seed=0, region_dir=None):
+    """
+    Write synthetic LC_Type1_<year>.tif rasters of size x size pixels.
+
+    Files mimic the shipped data: uint8 MODIS classes on the sinusoidal grid,
+    512x512 LZW tiles, nodata 255 and mode overviews. Classes come in patches
+    that partly change from one year to the next, so change detection and
+    transitions have work to do. Existing files are reused.
+
+    Args:
+        root (str): Directory to create the dataset directory in.
+        size (int): Width and height in pixels.
+        years (list): Years to generate.
+        seed (int): Seed of the random generator.
+        region_dir (str, optional): Directory whose GeoJSON regions are copied alongside.
+
+    Returns:
+        str: Path to the dataset directory.
+    """
+    data_dir = os.path.join(root, f"synthetic_{size}")
+    os.makedirs(data_dir, exist_ok=True)
+    if region_dir:
+        for region_path in glob.glob(os.path.join(region_dir, "*.geojson")):
+            shutil.copy(region_path, data_dir)
+
+    rng = np.random.default_rng(seed)
+    codes = np.array([code for code in VARIABLE_CODE_MAPPING.values() if code != 255], dtype=np.uint8)
+    patches = -(-size // PATCH_SIZE)
+    patch_classes = rng.choice(codes, size=(patches, patches))
+
+    for year in years:
+        file_path = os.path.join(data_dir, f"LC_Type1_{year}.tif")
+        if not os.path.exists(file_path):
+            array = np.repeat(np.repeat(patch_classes, PATCH_SIZE, axis=0), PATCH_SIZE, axis=1)[:size, :size]
+            noise = rng.random((size, size)) < PIXEL_NOISE_RATE
+            array[noise] = rng.choice(codes, size=int(noise.sum()))
+            _write_raster(file_path, array)
+
+        changed = rng.random(patch_classes.shape) < PATCH_CHANGE_RATE
+        patch_classes = np.where(changed, rng.choice(codes, size=patch_classes.shape), patch_classes)
+
+    return data_dir
+
+
+def _write_raster(file_path, array):
+    height, width = array.shape
+    profile = {
+        "driver": "GTiff",
+        "dtype": "uint8",
+        "count": 1,
+        "width": width,
+        "height": height,
+        "crs": MODIS_CRS,
+        "transform": Affine(PIXEL_SIZE, 0.0, ORIGIN[0], 0.0, -PIXEL_SIZE, ORIGIN[1]),
+        "nodata": 255,
+        "tiled": True,
+        "blockxsize": 512,
+        "blockysize": 512,
+        "compress": "lzw",
+    }
+    tmp_path = f"{file_path}.{os.getpid()}.tmp.tif"
+    with rasterio.open(tmp_path, "w", **profile) as dst:
+        dst.write(array, 1)
+        factors = [factor for factor in OVERVIEW_FACTORS if min(height, width) // factor >= 256]
+        if factors:
+            dst.build_overviews(factors, Resampling.mode)
+    os.replace(tmp_path, file_path)
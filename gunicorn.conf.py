@@ -0,0 +1,36 @@
+# Gunicorn settings. Usage: gunicorn app:app
+import os
+from utils.global_config import WARMUP_ENABLED, PRECOMPUTE_ENABLED
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+# Load the app in the master so the warm-up below is inherited by every worker
+preload_app = WARMUP_ENABLED
+
+
+def on_starting(server):
+    """Forget the metrics of earlier runs so /metrics only sums this server's workers."""
+    from utils import metrics
+    metrics.clear_directory()
+
+
+def when_ready(server):
+    """Warm up the master after the app is loaded and before the workers fork."""
+    if WARMUP_ENABLED:
+        from app import DATA_DIR
+        from utils.warmup import warm_up
+        from utils import metrics
+        warm_up(DATA_DIR)
+        # The master runs no flush thread; record its warm-up metrics once before forking
+        metrics.flush()
+
+
+def post_fork(server, worker):
+    """Start the precompute watcher in each worker; its threads would not survive the fork."""
+    if PRECOMPUTE_ENABLED:
+        from app import DATA_DIR
+        from utils.precompute import start_watcher
+        start_watcher(DATA_DIR)
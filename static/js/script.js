@@ -2,6 +2,7 @@ document.addEventListener("DOMContentLoaded", async function () {
     const variableSelect = document.getElementById("variable-select");
     const analysisTypeSelect = document.getElementById("analysis-type-select");
     const yearsSelect = document.getElementById("years-select");
+    const regionSelect = document.getElementById("region-select");
     const form = document.getElementById("analysis-form");
     const textResults = document.getElementById("text-results");
     const visualizationResults = document.getElementById("visualization-results");
@@ -15,6 +16,12 @@ document.addEventListener("DOMContentLoaded", async function () {
             populateDropdown(variableSelect, config.variables);
             populateDropdown(analysisTypeSelect, config.analysis_types);
             populateYearsDropdown(yearsSelect, config.years);
+            (config.regions || []).forEach(region => {
+                const opt = document.createElement("option");
+                opt.value = region.value;
+                opt.textContent = region.label;
+                regionSelect.appendChild(opt);
+            });
         } catch (error) {
             console.error("Error fetching configuration:", error);
             alert("Failed to load configuration. Please try again later.");
@@ -54,6 +61,7 @@ document.addEventListener("DOMContentLoaded", async function () {
         const analysisType = analysisTypeSelect.value;
         const selectedYears = Array.from(yearsSelect.selectedOptions).map(opt => opt.value);
         const comments = document.getElementById("additional-comments").value;
+        const region = regionSelect.value;
 
         // Validate inputs
         if (!variable) {
@@ -69,28 +77,72 @@ document.addEventListener("DOMContentLoaded", async function () {
             return;
         }
 
-        // Send data to the backend
+        // Send data to the backend; visualizations arrive first and the summary streams in after
         try {
-            const response = await fetch("/chat", {
+            const response = await fetch("/chat/stream", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
                     variable,
                     analysisType,
                     years: selectedYears,
-                    comments
+                    comments,
+                    region,
+                    imageFormat: "url"
                 }),
             });
 
-            const result = await response.json();
-            displayResults(result);
-            loadingSpinner.style.display = "none";
+            if (!response.headers.get("Content-Type").startsWith("text/event-stream")) {
+                // Validation messages come back as plain JSON
+                displayResults(await response.json());
+                loadingSpinner.style.display = "none";
+                return;
+            }
+
+            let textElement = null;
+            await readEventStream(response, (eventName, payload) => {
+                if (eventName === "result") {
+                    displayResults({ text: " ", image: payload.image });
+                    textElement = textResults.querySelector(".text-results-content");
+                    textElement.textContent = "";
+                    // The numbers are shown right away, before the summary streams in
+                    if (payload.stats) displayStats(payload.stats);
+                    loadingSpinner.style.display = "none";
+                } else if (eventName === "token" && textElement) {
+                    textElement.textContent += payload.text;
+                }
+            });
         } catch (error) {
             console.error("Error submitting form:", error);
             alert("Failed to process your request. Please try again.");
         }
+        loadingSpinner.style.display = "none";
     });
 
+    // Read a Server-Sent Events response body and call onEvent for every event
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let eventName = "message";
+                let data = "";
+                rawEvent.split("\n").forEach(line => {
+                    if (line.startsWith("event: ")) eventName = line.slice(7);
+                    else if (line.startsWith("data: ")) data += line.slice(6);
+                });
+                onEvent(eventName, data ? JSON.parse(data) : {});
+            }
+        }
+    }
+
     function displayResults(result) {
         // Clear previous results
         textResults.innerHTML = "";
@@ -116,14 +168,20 @@ document.addEventListener("DOMContentLoaded", async function () {
     
         // Display visualizations
         if (result.image) {
-            Object.entries(result.image).forEach(([vizType, base64String]) => {
+            Object.entries(result.image).forEach(([vizType, image]) => {
+                // Visualizations are artifact URLs, or base64 strings from older responses
+                const isUrl = image.startsWith("/artifacts/");
                 const container = document.createElement("div");
                 container.className = "visualization-container";
     
                 if (vizType === "map") {
                     // Logic for displaying the map in an iframe
                     const iframe = document.createElement('iframe');
-                    iframe.srcdoc = atob(result.image.map); // Decoding the base64 map HTML
+                    if (isUrl) {
+                        iframe.src = image;
+                    } else {
+                        iframe.srcdoc = atob(image); // Decoding the base64 map HTML
+                    }
                     iframe.className = "visualization-iframe";
                     iframe.style.width = "100%";
                     iframe.style.height = "1000px"; // Example height
@@ -132,7 +190,7 @@ document.addEventListener("DOMContentLoaded", async function () {
                 else {
                     // Logic for displaying the choropleth map as an image
                     const img = document.createElement("img");
-                    img.src = `data:image/png;base64,${base64String}`;
+                    img.src = isUrl ? image : `data:image/png;base64,${image}`;
                     img.alt = vizType;
                     img.className = "visualization-image";
                     container.appendChild(img);
@@ -142,6 +200,65 @@ document.addEventListener("DOMContentLoaded", async function () {
             });
         }
     }
+    function displayStats(stats) {
+        const container = document.createElement("div");
+        container.className = "text-results-container";
+
+        const title = document.createElement("h3");
+        title.textContent = "Statistics:";
+        title.className = "text-results-title";
+        container.appendChild(title);
+
+        const table = document.createElement("table");
+        table.className = "stats-table";
+        const header = table.insertRow();
+        ["Year", "Pixels", "Area (km²)"].forEach(label => {
+            const cell = document.createElement("th");
+            cell.textContent = label;
+            header.appendChild(cell);
+        });
+        stats.years.forEach(entry => {
+            const row = table.insertRow();
+            row.insertCell().textContent = entry.year;
+            row.insertCell().textContent = entry.pixel_count.toLocaleString();
+            row.insertCell().textContent = entry.area_km2.toLocaleString();
+        });
+        container.appendChild(table);
+
+        if (stats.stable) {
+            const stable = document.createElement("p");
+            stable.className = "text-results-content";
+            stable.textContent = `Present in every selected year: ${stats.stable.pixel_count.toLocaleString()} pixels, `
+                + `${stats.stable.area_km2.toLocaleString()} km²`;
+            container.appendChild(stable);
+        }
+
+        if (stats.transitions) {
+            // Largest changes between two different classes
+            const { years, variables, matrix } = stats.transitions;
+            const changes = [];
+            matrix.forEach((row, i) => row.forEach((count, j) => {
+                if (i !== j && count > 0) changes.push([count, variables[i], variables[j]]);
+            }));
+            changes.sort((a, b) => b[0] - a[0]);
+            if (changes.length) {
+                const subtitle = document.createElement("p");
+                subtitle.className = "text-results-content";
+                subtitle.textContent = `Largest class transitions ${years[0]}–${years[1]}:`;
+                container.appendChild(subtitle);
+                const list = document.createElement("ul");
+                changes.slice(0, 5).forEach(([count, from, to]) => {
+                    const item = document.createElement("li");
+                    item.textContent = `${from} → ${to}: ${count.toLocaleString()} pixels`;
+                    list.appendChild(item);
+                });
+                container.appendChild(list);
+            }
+        }
+
+        textResults.appendChild(container);
+    }
+
     // Initial configuration fetch
     fetchConfig();
 });
@@ -1,13 +1,64 @@
 import os
-import rasterio
 import numpy as np
-from utils.global_config import VARIABLES, YEARS, VARIABLE_CODE_MAPPING, ANALYSIS_VISUALIZATIONS
+from utils.global_config import (
+    VARIABLES, YEARS, VARIABLE_CODE_MAPPING, VARIABLE_GROUPS, ANALYSIS_VISUALIZATIONS,
+    RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES, LLM_MODEL, SUMMARY_CACHE_ENABLED, SUMMARY_CACHE_PATH,
+    SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_BYTES, SUMMARY_CACHE_STALE_TTL, SUMMARY_FALLBACK_ON_TIMEOUT,
+)
 from utils.visualization import generate_visualizations
-import rioxarray
-import openai
+from utils.statistics import compute_class_table, class_totals
+from utils.change_detection import compute_transitions
+from utils.trajectory import summarize_trajectories
+from utils.bitmask_index import variable_codes, compute_stable_stats
+from utils.response_cache import ResponseCache, data_versions
+from utils.summary_cache import SummaryCache, summary_key
+from utils.zonal import load_region
+from utils import llm, metrics
 from dotenv import load_dotenv
 load_dotenv()
 
+_response_cache = ResponseCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES)
+_summary_cache = SummaryCache(
+    SUMMARY_CACHE_PATH, SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_BYTES, SUMMARY_CACHE_STALE_TTL
+) if SUMMARY_CACHE_ENABLED else None
+
+# Generation parameters of the analysis summary; part of the summary cache key
+SUMMARY_PARAMS = {"max_tokens": 400, "temperature": 0.7}
+
+
+def _collect_response_cache():
+    stats = _response_cache.stats()
+    return [
+        ("cache_hits_total", "counter", {"cache": "response"}, stats["hits"]),
+        ("cache_misses_total", "counter", {"cache": "response"}, stats["misses"]),
+        ("cache_coalesced_total", "counter", {"cache": "response"}, stats["coalesced"]),
+        ("cache_entries", "gauge", {"cache": "response"}, stats["entries"]),
+        ("cache_pinned_entries", "gauge", {"cache": "response"}, stats["pinned"]),
+    ]
+
+
+metrics.register_collector(_collect_response_cache)
+
+
+def _collect_summary_cache():
+    if _summary_cache is None:
+        return []
+    stats = _summary_cache.stats()
+    return [
+        ("cache_hits_total", "counter", {"cache": "summary"}, stats["hits"]),
+        ("cache_misses_total", "counter", {"cache": "summary"}, stats["misses"]),
+        ("cache_coalesced_total", "counter", {"cache": "summary"}, stats["coalesced"]),
+        ("cache_stale_hits_total", "counter", {"cache": "summary"}, stats["stale_hits"]),
+        ("cache_evictions_total", "counter", {"cache": "summary"}, stats["evictions"]),
+        ("cache_entries", "gauge", {"cache": "summary"}, stats["entries"]),
+        ("cache_bytes", "gauge", {"cache": "summary"}, stats["bytes"]),
+    ]
+
+
+metrics.register_collector(_collect_summary_cache)
+
+
+@metrics.timed("analyze_query")
 def analyze_query(query, data_dir, metadata):
     """
     Process the entire analysis pipeline.
@@ -20,12 +71,65 @@ def analyze_query(query, data_dir, metadata):
         dict: Results including text summary and visualizations.
     """
     variable = query["variables"]
-    years = query["years"]
     analysis_type = query["intent"]
     user_comment = query["comments"]
+
+    result = get_analysis_result(query, data_dir)
+
+    # Generate text summary
+    text_summary = generate_analysis_summary(
+        result["data"], analysis_type, metadata, variable, user_comment, result["transitions"],
+        result["trajectories"], result["stable"],
+    )
+    return {
+        "summary": text_summary,
+        "visualizations": result["visualizations"],
+    }
+
+
+def get_analysis_result(query, data_dir, pin=None):
+    """
+    Return the statistics and visualizations of a query from the response cache.
+
+    Statistics and visualizations only depend on the normalized query and the
+    data files, so identical requests share one cached (or in-flight) computation.
+
+    Args:
+        query (dict): Parsed query from the user input.
+        data_dir (str): Path to the data directory.
+        pin (hashable, optional): Keep the result cached without expiry under this slot,
+            replacing the result pinned there before (see ResponseCache).
+
+    Returns:
+        dict: Output of compute_analysis.
+    """
+    years = [str(year) for year in query["years"]]
+    region = query.get("region")
+    region_key = load_region(region, data_dir)["key"] if region else None
+    key = (query["intent"], query["variables"], tuple(years), region_key, data_versions(years, data_dir))
+    return _response_cache.get_or_compute(
+        key, lambda: compute_analysis(dict(query, years=years), data_dir), pin
+    )
+
+
+def compute_analysis(query, data_dir):
+    """
+    Compute the statistics and visualizations of a query, without the text summary.
+
+    Args:
+        query (dict): Parsed query from the user input.
+        data_dir (str): Path to the data directory.
+
+    Returns:
+        dict: Per-year data, visualizations, class transitions, trajectory summary and
+              stable area (the last three None when not applicable).
+    """
+    variable = query["variables"]
+    years = query["years"]
+    analysis_type = query["intent"]
     # print("ANALYSIS TYPE: ", analysis_type)
     # Read and process raster data
-    data = read_raster_data(variable, years, data_dir)
+    data = read_raster_data(variable, years, data_dir, query.get("region"))
 
     # Suggest visualizations
     suggested_viz = suggest_visualizations(analysis_type)
@@ -33,15 +137,41 @@ def analyze_query(query, data_dir, metadata):
     # Generate visualizations
     visualizations = generate_visualizations(query,data_dir, data, suggested_viz)
 
-    # Generate text summary
-    text_summary = generate_analysis_summary(data, analysis_type, metadata, variable, user_comment)
+    # Class transitions between the first and last year back change detection and comparison
+    transitions = None
+    if analysis_type in ("change_detection", "comparison") and len(years) >= 2:
+        with metrics.span("transitions"):
+            region = load_region(query["region"], data_dir) if query.get("region") else None
+            transitions = compute_transitions(years[0], years[-1], data_dir, region)
+
+    # Trend and change questions also get the per-pixel history over the whole period,
+    # answered from the trajectory cube instead of decoding every year in between.
+    # The cube covers the whole raster, so region queries go without it
+    trajectories = None
+    if (analysis_type in ("trend_analysis", "change_detection") and len(years) >= 2
+            and variable not in VARIABLE_GROUPS and not query.get("region")):
+        with metrics.span("trajectories"):
+            trajectories = summarize_trajectories(get_variable_code(variable), years[0], years[-1], data_dir)
+
+    # Area covered by the variable in every selected year, intersected on the packed class bitmasks
+    stable = None
+    if analysis_type in ("change_detection", "comparison") and len(years) >= 2 and not query.get("region"):
+        with metrics.span("stable_area"):
+            stable = compute_stable_stats(
+                variable, [os.path.join(data_dir, f"LC_Type1_{year}.tif") for year in years]
+            )
+
     return {
-        "summary": text_summary,
+        "data": data,
         "visualizations": visualizations,
+        "transitions": transitions,
+        "trajectories": trajectories,
+        "stable": stable,
     }
 
 
-def read_raster_data(variable, years, data_dir):
+@metrics.timed("read_raster_data")
+def read_raster_data(variable, years, data_dir, region=None):
     """
     Read raster data for the given variable and years.
 
@@ -49,43 +179,34 @@ def read_raster_data(variable, years, data_dir):
         variable (str): The variable label (e.g., "classified_land").
         years (list): List of years to analyze.
         data_dir (str): Path to the directory containing raster files.
+        region (str or dict, optional): Named region or GeoJSON polygon to restrict the statistics to.
 
     Returns:
         dict: Processed raster data for each year.
     """
-    variable_code = get_variable_code(variable)
-    data = {}
+    codes = variable_codes(variable)
+    region = load_region(region, data_dir) if region else None
 
-    for year in years:
-        file_path = os.path.join(data_dir, f"LC_Type1_{year}.tif")
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Raster file not found for year {year}: {file_path}")
-
-        with rioxarray.open_rasterio(file_path) as raster:
-            print(f"Processing raster for year {year}")
-            print(f"Variable Code: {variable_code}")
-            unique_values = np.unique(raster.values)
-            print(f"Unique values in raster: {unique_values}")
-
-            # Apply mask for the variable code
-            variable_mask = raster.values == variable_code
-            pixel_count = variable_mask.sum()
-            area_km2 = pixel_count * 0.25  # Assuming 500m x 500m pixels
-
-            print(f"Year {year}: {pixel_count} pixels, {area_km2:.2f} km²")
-
-            # Store results
-            data[year] = {
-                "variable": variable,
-                "pixel_count": int(pixel_count),
-                "area_km2": round(area_km2, 2),
-                "transform": raster.rio.transform(),
-                "crs": raster.rio.crs,
-                "year": int(year),
-            }
+    # One year x class table serves every year; groups sum their classes' columns
+    table = compute_class_table(years, data_dir, region)
+    pixel_counts, areas = class_totals(table, codes)
 
+    data = {}
+    for index, year in enumerate(years):
+        print(f"Year {year}: {pixel_counts[index]} pixels, {areas[index]:.2f} km²")
+        data[year] = {
+            "variable": variable,
+            "pixel_count": int(pixel_counts[index]),
+            "area_km2": round(float(areas[index]), 2),
+            "transform": table["transforms"][index],
+            "crs": table["crs"][index],
+            "year": int(year),
+        }
+        if region is not None:
+            data[year]["region"] = region["name"]
     return data
 
+
 def get_variable_code(variable):
     """
     Map the variable label to its corresponding numeric code.
@@ -101,22 +222,111 @@ def get_variable_code(variable):
     return VARIABLE_CODE_MAPPING[variable]
 
 
-# Set OpenAI API key
-def generate_analysis_summary(data, analysis_type, metadata, variable, user_comment=None):
+def generate_analysis_summary(data, analysis_type, metadata, variable, user_comment=None, transitions=None,
+                              trajectories=None, stable=None):
     """
     Generate a text summary using ChatGPT API based on the analysis type, processed data, and metadata.
 
+    Summaries are cached on a hash of the prompt and model parameters, so
+    identical statistics and comments skip the model call.
+
     Args:
         data (dict): Processed raster data where each key is a year and the value is a dictionary with analysis details.
         analysis_type (str): Type of analysis requested.
         metadata (dict): Information about the data and processing.
         variable (str): The variable being analyzed.
         user_comment (str, optional): Additional comment or question from the user.
+        transitions (dict, optional): Class transition matrix from compute_transitions.
+        trajectories (dict, optional): Pixel history summary from summarize_trajectories.
+        stable (dict, optional): Area in every selected year from compute_stable_stats.
 
     Returns:
         str: Text summary of the analysis.
     """
-    openai.api_key = os.getenv('OPENAI_API_KEY') 
+    messages = build_summary_messages(
+        data, analysis_type, metadata, variable, user_comment, transitions, trajectories, stable
+    )
+
+    key = summary_key(messages, LLM_MODEL, **SUMMARY_PARAMS)
+
+    # Call ChatGPT API through the shared client
+    try:
+        with metrics.span("llm_summary"):
+            if _summary_cache is None:
+                return llm.complete(messages, **SUMMARY_PARAMS)
+            return _summary_cache.get_or_compute(key, lambda: llm.complete(messages, **SUMMARY_PARAMS))
+    except Exception as e:
+        print(f"Error generating summary: {e}")
+        fallback = _fallback_summary(key, e)
+        if fallback is not None:
+            return fallback
+        return "An error occurred while generating the summary."
+
+
+def stream_analysis_summary(data, analysis_type, metadata, variable, user_comment=None, transitions=None,
+                            trajectories=None, stable=None):
+    """
+    Generate the text summary like generate_analysis_summary, yielding it as it is produced.
+
+    Args:
+        data (dict): Processed raster data keyed by year.
+        analysis_type (str): Type of analysis requested.
+        metadata (dict): Information about the data and processing.
+        variable (str): The variable being analyzed.
+        user_comment (str, optional): Additional comment or question from the user.
+        transitions (dict, optional): Class transition matrix from compute_transitions.
+        trajectories (dict, optional): Pixel history summary from summarize_trajectories.
+        stable (dict, optional): Area in every selected year from compute_stable_stats.
+
+    Yields:
+        str: Fragments of the summary text.
+    """
+    messages = build_summary_messages(
+        data, analysis_type, metadata, variable, user_comment, transitions, trajectories, stable
+    )
+    key = summary_key(messages, LLM_MODEL, **SUMMARY_PARAMS)
+    generated = False
+    try:
+        with metrics.span("llm_summary_stream"):
+            if _summary_cache is None:
+                fragments = llm.stream(messages, **SUMMARY_PARAMS)
+            else:
+                fragments = _summary_cache.stream(key, lambda: llm.stream(messages, **SUMMARY_PARAMS))
+            for text in fragments:
+                generated = True
+                yield text
+    except Exception as e:
+        print(f"Error generating summary: {e}")
+        # A cached answer can only replace the summary if none of it was sent yet
+        fallback = None if generated else _fallback_summary(key, e)
+        yield fallback if fallback is not None else "An error occurred while generating the summary."
+
+
+def _fallback_summary(key, error):
+    """Return a cached summary, even an expired one, when the model timed out."""
+    if _summary_cache is None or not SUMMARY_FALLBACK_ON_TIMEOUT or not llm.is_timeout(error):
+        return None
+    return _summary_cache.fallback(key)
+
+
+def build_summary_messages(data, analysis_type, metadata, variable, user_comment=None, transitions=None,
+                           trajectories=None, stable=None):
+    """
+    Build the chat messages asking the model to summarize the analysis.
+
+    Args:
+        data (dict): Processed raster data keyed by year.
+        analysis_type (str): Type of analysis requested.
+        metadata (dict): Information about the data and processing.
+        variable (str): The variable being analyzed.
+        user_comment (str, optional): Additional comment or question from the user.
+        transitions (dict, optional): Class transition matrix from compute_transitions.
+        trajectories (dict, optional): Pixel history summary from summarize_trajectories.
+        stable (dict, optional): Area in every selected year from compute_stable_stats.
+
+    Returns:
+        list: System and user messages.
+    """
     # Extract summary statistics from the data
     summary_stats = []
     for year, details in data.items():
@@ -125,6 +335,16 @@ def generate_analysis_summary(data, analysis_type, metadata, variable, user_comm
             f"Variable={details['variable']}, "
             f"Pixel Count={details['pixel_count']}, "
             f"Area={details['area_km2']} km²"
+            + (f", Region={details['region']}" if "region" in details else "")
+        )
+
+    if transitions is not None:
+        summary_stats.append(describe_transitions(transitions, variable))
+    if trajectories is not None:
+        summary_stats.append(describe_trajectories(trajectories, variable))
+    if stable is not None:
+        summary_stats.append(
+            f"Present in every selected year: Pixel Count={stable['pixel_count']}, Area={stable['area_km2']} km²"
         )
 
     stats_summary = "\n".join(summary_stats)
@@ -150,22 +370,63 @@ def generate_analysis_summary(data, analysis_type, metadata, variable, user_comm
     Response:
     """
 
-    # Call ChatGPT API with updated method
-    try:
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a data analyst assistant."},
-                {"role": "user", "content": prompt},
-            ],
-            max_tokens=400,
-            temperature=0.7,
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"Error generating summary: {e}")
-        return "An error occurred while generating the summary."
+    return [
+        {"role": "system", "content": "You are a data analyst assistant."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def describe_transitions(transitions, variable):
+    """
+    Describe the gains and losses of a variable from a transition matrix.
+
+    Args:
+        transitions (dict): Output of compute_transitions.
+        variable (str): The variable being analyzed.
 
+    Returns:
+        str: One line listing the main classes the variable was converted from and to.
+    """
+    # Groups are treated as one class: moves between their members count as unchanged
+    indices = [transitions["codes"].index(code) for code in variable_codes(variable)]
+    matrix = transitions["matrix"]
+    year_from, year_to = transitions["years"]
+    names = transitions["variables"]
+    others = [i for i in range(len(names)) if i not in indices]
+
+    gains = [(int(matrix[i, indices].sum()), names[i]) for i in others if matrix[i, indices].any()]
+    losses = [(int(matrix[indices, j].sum()), names[j]) for j in others if matrix[indices, j].any()]
+    gains_text = ", ".join(f"{name}={count}" for count, name in sorted(gains, reverse=True)[:5]) or "none"
+    losses_text = ", ".join(f"{name}={count}" for count, name in sorted(losses, reverse=True)[:5]) or "none"
+    return (
+        f"Transitions {year_from}->{year_to}: "
+        f"Unchanged={int(matrix[np.ix_(indices, indices)].sum())} pixels, "
+        f"Gained from ({gains_text}), "
+        f"Lost to ({losses_text})"
+    )
+
+
+def describe_trajectories(trajectories, variable):
+    """
+    Describe the per-pixel history of a variable from a trajectory summary.
+
+    Args:
+        trajectories (dict): Output of summarize_trajectories.
+        variable (str): The variable being analyzed.
+
+    Returns:
+        str: One line with change, persistence and first-conversion figures.
+    """
+    year_from, year_to = trajectories["years"]
+    conversions = ", ".join(
+        f"{year}={count} pixels ({area:.2f} km²)" for year, (count, area) in trajectories["first_conversions"].items()
+    ) or "none"
+    return (
+        f"Pixel histories {year_from}-{year_to}: "
+        f"Changed at least once={trajectories['changed_pixels']} pixels (all classes), "
+        f"{variable} unchanged throughout={trajectories['persistent_pixels']} pixels, "
+        f"First conversion to {variable} by year ({conversions})"
+    )
 
 
 def suggest_visualizations(analysis_type):
@@ -0,0 +1,186 @@
+import os
+import re
+import gzip
+import base64
+import time
+import hashlib
+import threading
+from utils.global_config import CACHE_SUBDIR, ARTIFACT_CACHE_MAX_BYTES
+from utils.cache_util import atomic_write
+
+# Media type of each artifact extension
+MEDIA_TYPES = {
+    "png": "image/png",
+    "html": "text/html",
+}
+
+# Extensions worth storing a gzip copy of; PNG data is already deflated
+COMPRESSIBLE = {"html"}
+
+ARTIFACT_NAME = re.compile(r"^([0-9a-f]{64})\.(png|html)$")
+
+# Minimum seconds between two scans of the artifact directory for eviction
+PRUNE_INTERVAL = 60
+
+_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def store_artifact(data, extension, data_dir):
+    """
+    Store bytes under a name derived from their SHA-256 and return its URL.
+
+    Identical content always maps to the same name, so repeated
+    visualizations are written once and stay cacheable by browsers. Reuse
+    refreshes an artifact's mtime, and the least recently stored artifacts
+    are evicted once the directory exceeds ARTIFACT_CACHE_MAX_BYTES.
+
+    Args:
+        data (bytes): Artifact content.
+        extension (str): One of MEDIA_TYPES.
+        data_dir (str): Path to the data directory holding the cache.
+
+    Returns:
+        str: URL of the artifact, e.g. /artifacts/<hash>.png.
+    """
+    if extension not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported artifact type: {extension}")
+    name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+    path = _artifact_path(name, data_dir)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        with atomic_write(path) as f:
+            f.write(data)
+        _maybe_prune(data_dir)
+    if extension in COMPRESSIBLE and not os.path.exists(f"{path}.gz"):
+        with atomic_write(f"{path}.gz") as f:
+            f.write(gzip.compress(data, compresslevel=6, mtime=0))
+    return f"/artifacts/{name}"
+
+
+def artifact_exists(name, data_dir):
+    """
+    Tell whether a name is a valid, stored artifact.
+
+    Args:
+        name (str): Artifact file name, <hash>.<extension>.
+        data_dir (str): Path to the data directory holding the cache.
+
+    Returns:
+        bool: True if the artifact can be served.
+    """
+    return ARTIFACT_NAME.match(name) is not None and os.path.exists(_artifact_path(name, data_dir))
+
+
+def prune_artifacts(data_dir, max_bytes=ARTIFACT_CACHE_MAX_BYTES):
+    """
+    Delete the least recently stored artifacts until the cache fits in max_bytes.
+
+    Args:
+        data_dir (str): Path to the data directory holding the cache.
+        max_bytes (int): Size budget of the artifact directory, gzip copies included.
+
+    Returns:
+        int: Number of artifacts deleted.
+    """
+    artifacts = []  # (mtime, bytes including the gzip copy, path)
+    total = 0
+    root = os.path.join(data_dir, CACHE_SUBDIR, "artifacts")
+    for prefix in _scandir(root):
+        for entry in _scandir(prefix.path):
+            if ARTIFACT_NAME.match(entry.name) is None:
+                continue
+            try:
+                stat = entry.stat()
+                size = stat.st_size
+                if os.path.exists(f"{entry.path}.gz"):
+                    size += os.path.getsize(f"{entry.path}.gz")
+            except FileNotFoundError:
+                continue
+            artifacts.append((stat.st_mtime, size, entry.path))
+            total += size
+
+    deleted = 0
+    for _, size, path in sorted(artifacts):
+        if total <= max_bytes:
+            break
+        for stale_path in (f"{path}.gz", path):
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                pass
+        total -= size
+        deleted += 1
+    return deleted
+
+
+def load_artifact(name, data_dir, accept_gzip=False):
+    """
+    Read a stored artifact.
+
+    Args:
+        name (str): Artifact file name, <hash>.<extension>.
+        data_dir (str): Path to the data directory holding the cache.
+        accept_gzip (bool): Return the gzip copy when one exists.
+
+    Returns:
+        tuple: (content bytes, media type, content encoding or None).
+
+    Raises:
+        FileNotFoundError: If the name is invalid or the artifact is missing.
+    """
+    match = ARTIFACT_NAME.match(name)
+    if match is None:
+        raise FileNotFoundError(f"Invalid artifact name: {name}")
+    extension = match.group(2)
+    path = _artifact_path(name, data_dir)
+    if accept_gzip and extension in COMPRESSIBLE:
+        try:
+            with open(f"{path}.gz", "rb") as f:
+                return f.read(), MEDIA_TYPES[extension], "gzip"
+        except OSError:
+            pass
+    with open(path, "rb") as f:
+        return f.read(), MEDIA_TYPES[extension], None
+
+
+def externalize_visualizations(visualizations, data_dir):
+    """
+    Replace base64 visualizations with URLs of content-addressed artifacts.
+
+    The interactive map is stored as HTML and every other entry as PNG.
+
+    Args:
+        visualizations (dict): Visualization type -> base64 string.
+        data_dir (str): Path to the data directory holding the cache.
+
+    Returns:
+        dict: Visualization type -> artifact URL.
+    """
+    return {
+        viz: store_artifact(base64.b64decode(encoded), "html" if viz == "map" else "png", data_dir)
+        for viz, encoded in visualizations.items()
+    }
+
+
+def _maybe_prune(data_dir):
+    """Run prune_artifacts at most once per PRUNE_INTERVAL in this process."""
+    global _last_prune
+    with _lock:
+        if time.monotonic() - _last_prune < PRUNE_INTERVAL:
+            return
+        _last_prune = time.monotonic()
+    prune_artifacts(data_dir)
+
+
+def _scandir(path):
+    try:
+        with os.scandir(path) as entries:
+            return [entry for entry in entries if not entry.name.endswith(".tmp")]
+    except FileNotFoundError:
+        return []
+
+
+def _artifact_path(name, data_dir):
+    return os.path.join(data_dir, CACHE_SUBDIR, "artifacts", name[:2], name)
@@ -0,0 +1,222 @@
+import os
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from utils.global_config import VARIABLE_CODE_MAPPING, VARIABLE_GROUPS, CACHE_SUBDIR
+from utils.raster_cache import read_raster
+from utils.block_reduce import should_stream
+from utils.pixel_area import get_row_areas
+from utils.cache_util import file_signature, atomic_write
+from utils import metrics
+
+# Rows compared and packed at once when a raster is too large to decode whole
+CHUNK_ROWS = 512
+
+_lock = threading.Lock()
+_bits = OrderedDict()  # (path, mtime_ns, size, code) -> packed mask, least recently used first
+_current_versions = set()  # bitmask directories whose older versions were already removed
+MAX_CACHED_BITS = 256
+
+
+def variable_codes(variable):
+    """
+    Return the class codes a variable stands for.
+
+    Args:
+        variable (str): A class from VARIABLE_CODE_MAPPING or a group from VARIABLE_GROUPS.
+
+    Returns:
+        list: Class codes; a single code for plain classes.
+
+    Raises:
+        ValueError: If the variable is unknown.
+    """
+    if variable in VARIABLE_GROUPS:
+        return [VARIABLE_CODE_MAPPING[member] for member in VARIABLE_GROUPS[variable]]
+    if variable in VARIABLE_CODE_MAPPING:
+        return [VARIABLE_CODE_MAPPING[variable]]
+    raise ValueError(f"Invalid variable: {variable}")
+
+
+def class_mask(array, codes):
+    """
+    Return the boolean mask of the pixels belonging to any of the codes.
+
+    Args:
+        array (np.ndarray): Class codes.
+        codes (list): Codes to select.
+
+    Returns:
+        np.ndarray: Boolean array of the same shape.
+    """
+    if len(codes) == 1:
+        return array == codes[0]
+    return np.isin(array, codes)
+
+
+def get_class_bits(file_path, code):
+    """
+    Return the bit-packed mask of one class in a raster.
+
+    Each row is packed separately with np.packbits, so the result has shape
+    (height, ceil(width / 8)) and row r of the packed array is row r of the
+    raster. Masks are built on first use, persisted as .npy files next to the
+    data and memory-mapped afterwards.
+
+    Args:
+        file_path (str): Path to the raster file.
+        code (int): Class code.
+
+    Returns:
+        np.ndarray: Read-only uint8 array of packed bits.
+    """
+    mtime_ns, size = file_signature(file_path)
+    key = (os.path.abspath(file_path), mtime_ns, size, code)
+    with _lock:
+        bits = _bits.get(key)
+        if bits is not None:
+            _bits.move_to_end(key)
+            return bits
+
+    data_dir, file_name = os.path.split(key[0])
+    stem = os.path.splitext(file_name)[0]
+    version = f"{stem}-{mtime_ns}-{size}"
+    bits_path = os.path.join(data_dir, CACHE_SUBDIR, "bitmasks", version, f"{code}.npy")
+    if not os.path.exists(bits_path):
+        _purge_stale_bits(key[0], stem, version)
+        with metrics.span("bitmask_build"):
+            packed = _pack_class(file_path, code)
+        with atomic_write(bits_path) as f:
+            np.save(f, packed)
+    bits = np.load(bits_path, mmap_mode="r")
+
+    with _lock:
+        _bits[key] = bits
+        while len(_bits) > MAX_CACHED_BITS:
+            _bits.popitem(last=False)
+    return bits
+
+
+def union_bits(file_path, codes):
+    """
+    Return the packed mask of the pixels of a raster belonging to any of the codes.
+
+    Args:
+        file_path (str): Path to the raster file.
+        codes (list): Class codes.
+
+    Returns:
+        np.ndarray: uint8 array of packed bits.
+    """
+    bits = np.array(get_class_bits(file_path, codes[0]))
+    for code in codes[1:]:
+        np.bitwise_or(bits, get_class_bits(file_path, code), out=bits)
+    return bits
+
+
+def intersect_years(file_paths, codes):
+    """
+    Return the packed mask of the pixels belonging to the codes in every raster.
+
+    Args:
+        file_paths (list): Rasters of the years to intersect, all on the same grid.
+        codes (list): Class codes, combined as a union within each year.
+
+    Returns:
+        np.ndarray: uint8 array of packed bits.
+    """
+    bits = union_bits(file_paths[0], codes)
+    for file_path in file_paths[1:]:
+        year_bits = union_bits(file_path, codes)
+        if year_bits.shape != bits.shape:
+            raise ValueError("Bitmask intersection requires every year on the same grid.")
+        np.bitwise_and(bits, year_bits, out=bits)
+    return bits
+
+
+def count_bits(bits, transform, crs, width):
+    """
+    Count the set pixels of a packed mask and their ground area.
+
+    Popcounts are taken per row on the packed bytes and weighted by the
+    row's pixel area, without unpacking the mask.
+
+    Args:
+        bits (np.ndarray): Packed mask from get_class_bits or its combinations.
+        transform (Affine): Transform of the raster grid.
+        crs (CRS): CRS of the raster grid.
+        width (int): Width of the raster in pixels.
+
+    Returns:
+        tuple: (pixel count, area in km²).
+    """
+    row_counts = np.bitwise_count(bits).sum(axis=1, dtype=np.int64)
+    row_areas = get_row_areas(transform, crs, bits.shape[0], width)
+    return int(row_counts.sum()), float(row_counts @ row_areas)
+
+
+def unpack_bits(bits, width):
+    """
+    Expand a packed mask back to one boolean per pixel.
+
+    Args:
+        bits (np.ndarray): Packed mask.
+        width (int): Width of the raster in pixels.
+
+    Returns:
+        np.ndarray: Boolean array of shape (height, width).
+    """
+    return np.unpackbits(bits, axis=1, count=width).view(bool)
+
+
+def compute_stable_stats(variable, file_paths):
+    """
+    Measure the pixels that belong to a variable in every one of several rasters.
+
+    Args:
+        variable (str): Class or group name.
+        file_paths (list): Rasters of the selected years, all on the same grid.
+
+    Returns:
+        dict: {"pixel_count": int, "area_km2": float}.
+    """
+    bits = intersect_years(file_paths, variable_codes(variable))
+    with rasterio.open(file_paths[0]) as src:
+        pixel_count, area_km2 = count_bits(bits, src.transform, src.crs, src.width)
+    return {"pixel_count": pixel_count, "area_km2": round(area_km2, 2)}
+
+
+def _purge_stale_bits(file_path, stem, version):
+    """Remove the masks of older versions of a raster from memory and disk, once per new version."""
+    bitmasks_dir = os.path.join(os.path.dirname(file_path), CACHE_SUBDIR, "bitmasks")
+    with _lock:
+        if (bitmasks_dir, version) in _current_versions:
+            return
+        _current_versions.add((bitmasks_dir, version))
+        for key in [key for key in _bits if key[0] == file_path and f"{stem}-{key[1]}-{key[2]}" != version]:
+            del _bits[key]
+    try:
+        names = os.listdir(bitmasks_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith(f"{stem}-") and name != version:
+            shutil.rmtree(os.path.join(bitmasks_dir, name), ignore_errors=True)
+
+
+def _pack_class(file_path, code):
+    """Compare a raster to one class code and pack the result row by row."""
+    if not should_stream(file_path):
+        return np.packbits(read_raster(file_path).array == code, axis=1)
+
+    with rasterio.open(file_path) as src:
+        packed = np.empty((src.height, -(-src.width // 8)), dtype=np.uint8)
+        for row in range(0, src.height, CHUNK_ROWS):
+            window = Window(0, row, src.width, min(CHUNK_ROWS, src.height - row))
+            block = src.read(1, window=window)
+            metrics.increment("raster_bytes_read_total", block.nbytes, read="strip")
+            packed[row:row + block.shape[0]] = np.packbits(block == code, axis=1)
+    return packed
@@ -0,0 +1,60 @@
+import numpy as np
+import rasterio
+from utils.global_config import STREAMING_MIN_PIXELS
+from utils.pixel_area import get_row_areas, class_counts_and_areas
+from utils import metrics
+
+
+def should_stream(file_path):
+    """
+    Decide whether a raster is too large to be decoded in one piece.
+
+    Args:
+        file_path (str): Path to the raster file.
+
+    Returns:
+        bool: True when the raster has more than STREAMING_MIN_PIXELS pixels.
+    """
+    with rasterio.open(file_path) as src:
+        return src.width * src.height > STREAMING_MIN_PIXELS
+
+
+def iter_blocks(file_path):
+    """
+    Yield the raster's internal tiles one at a time with windowed reads.
+
+    Args:
+        file_path (str): Path to the raster file.
+
+    Yields:
+        tuple: (rasterio Window, uint8 array of the block).
+    """
+    with rasterio.open(file_path) as src:
+        for _, window in src.block_windows(1):
+            block = src.read(1, window=window)
+            metrics.increment("raster_bytes_read_total", block.nbytes, read="block")
+            yield window, block
+
+
+def stream_class_stats(file_path):
+    """
+    Count the pixels and ground area of every class code block by block.
+
+    Args:
+        file_path (str): Path to the raster file.
+
+    Returns:
+        tuple: (int64 histogram of length 256, float64 areas in km² of length 256).
+    """
+    with rasterio.open(file_path) as src:
+        row_areas = get_row_areas(src.transform, src.crs, src.height, src.width)
+
+    histogram = np.zeros(256, dtype=np.int64)
+    areas = np.zeros(256, dtype=np.float64)
+    for window, block in iter_blocks(file_path):
+        rows = slice(window.row_off, window.row_off + window.height)
+        block_histogram, block_areas = class_counts_and_areas(block, row_areas[rows])
+        histogram += block_histogram
+        areas += block_areas
+    return histogram, areas
+
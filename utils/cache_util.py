@@ -0,0 +1,85 @@
+import os
+import threading
+from contextlib import contextmanager
+
+
+def file_signature(file_path):
+    """
+    Build the signature used to detect changes to a file.
+
+    Args:
+        file_path (str): Path to the file.
+
+    Returns:
+        tuple: (mtime_ns, size) of the file.
+    """
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+@contextmanager
+def atomic_write(path, mode="wb", encoding=None):
+    """
+    Open a temporary file that replaces path once the block completes.
+
+    The temporary name is unique per process and thread, so concurrent
+    writers in other workers or threads never see or clobber a partial file.
+    The temporary file is removed if the block raises.
+
+    Args:
+        path (str): Final location of the file; missing directories are created.
+        mode (str): Mode to open the temporary file with, "wb" or "w".
+        encoding (str, optional): Text encoding for mode "w".
+
+    Yields:
+        file: The open temporary file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def single_flight(lock, pending, key, lookup, compute):
+    """
+    Return a cached value, or compute it in one thread while concurrent callers wait.
+
+    lookup runs while holding lock and returns the cached value or None. On a
+    miss the first caller runs compute, which is expected to store its result
+    where lookup finds it; callers arriving meanwhile wait for it and look up
+    again, taking over the computation if it failed.
+
+    Args:
+        lock (threading.Lock): Lock guarding the cache and pending.
+        pending (dict): Key -> Event of the computations in flight, owned by the cache.
+        key (hashable): Cache key.
+        lookup (callable): Zero-argument function returning the cached value or None.
+        compute (callable): Zero-argument function computing and storing the value.
+
+    Returns:
+        The cached or freshly computed value.
+    """
+    while True:
+        with lock:
+            value = lookup()
+            if value is not None:
+                return value
+            event = pending.get(key)
+            if event is None:
+                pending[key] = threading.Event()
+                break
+        event.wait()
+
+    try:
+        return compute()
+    finally:
+        with lock:
+            pending.pop(key).set()
@@ -0,0 +1,206 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+import rasterio
+import rasterio.windows
+from utils.global_config import VARIABLE_CODE_MAPPING, CACHE_SUBDIR
+from utils.raster_cache import read_raster
+from utils.block_reduce import should_stream, iter_blocks
+from utils.overviews import read_for_display
+from utils.bitmask_index import variable_codes, class_mask
+from utils.zonal import get_region_mask
+from utils.cache_util import file_signature, atomic_write, single_flight
+
+# Rows combined per bincount call; bounds the temporary key array
+CHUNK_ROWS = 512
+
+# Values of the per-pixel change raster
+CHANGE_NONE = 0
+CHANGE_GAIN = 1
+CHANGE_LOSS = 2
+CHANGE_OTHER = 3
+
+_lock = threading.Lock()
+_matrices = OrderedDict()  # (from path, from signature, to path, to signature, region key) -> transition dict
+_loading = {}  # same key -> Event set once the matrix is cached
+MAX_CACHED_MATRICES = 1024
+
+
+def compute_transitions(year_from, year_to, data_dir, region=None):
+    """
+    Build the full from/to class transition matrix between two years.
+
+    Each pixel pair is packed into one uint16 key (from_code << 8 | to_code)
+    so a single bincount counts every transition. Matrices are cached in
+    memory per pair of file versions and region, and on disk except for
+    custom GeoJSON regions, which would otherwise add a file per polygon.
+
+    Args:
+        year_from (str): Earlier year.
+        year_to (str): Later year.
+        data_dir (str): Path to the directory containing raster files.
+        region (dict, optional): Region from load_region to restrict the counts to.
+
+    Returns:
+        dict: {"years": [from, to], "variables": [str], "codes": [int],
+               "matrix": np.ndarray of shape (n_classes, n_classes)} where
+               matrix[i, j] counts pixels going from codes[i] to codes[j].
+    """
+    path_from, path_to = _year_path(year_from, data_dir), _year_path(year_to, data_dir)
+    signatures = (file_signature(path_from), file_signature(path_to))
+    region_key = region["key"] if region else None
+    key = (os.path.abspath(path_from), signatures[0], os.path.abspath(path_to), signatures[1], region_key)
+
+    def lookup():
+        cached = _matrices.get(key)
+        if cached is not None:
+            _matrices.move_to_end(key)
+        return cached
+
+    def count():
+        file_name = f"{year_from}_{year_to}.json" if region is None else f"{year_from}_{year_to}_{region_key}.json"
+        cache_path = os.path.join(data_dir, CACHE_SUBDIR, "transitions", file_name)
+        persist = region is None or not region.get("custom")
+        result = _load_matrix(cache_path, signatures) if persist else None
+        if result is None:
+            if region is None:
+                result = _count_transitions(path_from, path_to)
+            else:
+                result = _count_region_transitions(path_from, path_to, region)
+            result["years"] = [int(year_from), int(year_to)]
+            if persist:
+                _save_matrix(cache_path, signatures, result)
+        with _lock:
+            _matrices[key] = result
+            while len(_matrices) > MAX_CACHED_MATRICES:
+                _matrices.popitem(last=False)
+        return result
+
+    return single_flight(_lock, _loading, key, lookup, count)
+
+
+def compute_change_raster(variable, year_from, year_to, data_dir, target_size=None, region=None):
+    """
+    Classify every pixel by how the given variable changed between two years.
+
+    Args:
+        variable (str): The land cover type to track.
+        year_from (str): Earlier year.
+        year_to (str): Later year.
+        data_dir (str): Path to the directory containing raster files.
+        target_size (int, optional): Compare the coarsest overview level with at least
+            this many pixels on its longest side instead of full resolution.
+        region (dict, optional): Region from load_region; the result is cropped to its
+            bounding window and pixels outside it are CHANGE_NONE.
+
+    Returns:
+        tuple: (uint8 array of CHANGE_* values, Affine transform, CRS).
+    """
+    codes = variable_codes(variable)
+    if target_size is None:
+        before = read_raster(_year_path(year_from, data_dir))
+        after = read_raster(_year_path(year_to, data_dir)).array
+    else:
+        before = read_for_display(_year_path(year_from, data_dir), target_size)
+        after = read_for_display(_year_path(year_to, data_dir), target_size).array
+    if before.array.shape != after.shape:
+        raise ValueError("Change detection requires both years on the same grid.")
+
+    was_variable = class_mask(before.array, codes)
+    is_variable = class_mask(after, codes)
+    change = np.where(before.array != after, CHANGE_OTHER, CHANGE_NONE).astype(np.uint8)
+    change[is_variable & ~was_variable] = CHANGE_GAIN
+    change[was_variable & ~is_variable] = CHANGE_LOSS
+    if region is None:
+        return change, before.transform, before.crs
+
+    window, mask = get_region_mask(region, before.transform, before.crs, change.shape)
+    if not mask.size:
+        change[:] = CHANGE_NONE
+        return change, before.transform, before.crs
+    change = change[window.toslices()]
+    change[~mask] = CHANGE_NONE
+    return change, rasterio.windows.transform(window, before.transform), before.crs
+
+
+def _count_transitions(path_from, path_to):
+    """Count from/to pairs of class codes in one vectorized pass."""
+    histogram = np.zeros(256 * 256, dtype=np.int64)
+    if should_stream(path_from) or should_stream(path_to):
+        # Too large to decode whole; read the later year through the earlier year's blocks
+        with rasterio.open(path_from) as src_from, rasterio.open(path_to) as src_to:
+            if src_from.shape != src_to.shape:
+                raise ValueError("Change detection requires both years on the same grid.")
+            for window, before in iter_blocks(path_from):
+                after = src_to.read(1, window=window)
+                histogram += np.bincount(_pair_keys(before, after).ravel(), minlength=histogram.size)
+    else:
+        before = read_raster(path_from).array
+        after = read_raster(path_to).array
+        if before.shape != after.shape:
+            raise ValueError("Change detection requires both years on the same grid.")
+        for row in range(0, before.shape[0], CHUNK_ROWS):
+            keys = _pair_keys(before[row:row + CHUNK_ROWS], after[row:row + CHUNK_ROWS])
+            histogram += np.bincount(keys.ravel(), minlength=histogram.size)
+
+    codes = list(VARIABLE_CODE_MAPPING.values())
+    matrix = histogram.reshape(256, 256)[np.ix_(codes, codes)]
+    return {"variables": list(VARIABLE_CODE_MAPPING), "codes": codes, "matrix": matrix}
+
+
+def _count_region_transitions(path_from, path_to, region):
+    """Count from/to pairs of class codes inside a region, reading only its bounding window."""
+    with rasterio.open(path_from) as src_from, rasterio.open(path_to) as src_to:
+        if src_from.shape != src_to.shape:
+            raise ValueError("Change detection requires both years on the same grid.")
+        window, mask = get_region_mask(region, src_from.transform, src_from.crs, src_from.shape)
+        if mask.size:
+            keys = _pair_keys(src_from.read(1, window=window)[mask], src_to.read(1, window=window)[mask])
+            histogram = np.bincount(keys, minlength=256 * 256)
+        else:
+            histogram = np.zeros(256 * 256, dtype=np.int64)
+
+    codes = list(VARIABLE_CODE_MAPPING.values())
+    matrix = histogram.reshape(256, 256)[np.ix_(codes, codes)]
+    return {"variables": list(VARIABLE_CODE_MAPPING), "codes": codes, "matrix": matrix}
+
+
+def _pair_keys(before, after):
+    """Pack co-located class codes into from_code << 8 | to_code keys."""
+    return (before.astype(np.uint16) << 8) | after
+
+
+def _year_path(year, data_dir):
+    file_path = os.path.join(data_dir, f"LC_Type1_{year}.tif")
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Raster file not found for year {year}: {file_path}")
+    return file_path
+
+
+def _load_matrix(cache_path, signatures):
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("signatures") != [list(signature) for signature in signatures]:
+        return None
+    return {
+        "years": cached["years"],
+        "variables": cached["variables"],
+        "codes": cached["codes"],
+        "matrix": np.array(cached["matrix"], dtype=np.int64),
+    }
+
+
+def _save_matrix(cache_path, signatures, result):
+    with atomic_write(cache_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "signatures": [list(signature) for signature in signatures],
+            "years": result["years"],
+            "variables": result["variables"],
+            "codes": result["codes"],
+            "matrix": result["matrix"].tolist(),
+        }, f)
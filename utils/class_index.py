@@ -0,0 +1,126 @@
+import os
+import json
+import threading
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from utils.global_config import VARIABLE_CODE_MAPPING, CACHE_SUBDIR
+from utils.cache_util import file_signature, atomic_write
+from utils.raster_cache import read_raster
+from utils.block_reduce import should_stream, stream_class_stats
+from utils.pixel_area import get_row_areas, class_counts_and_areas
+
+INDEX_FILENAME = "class_index.json"
+INDEX_VERSION = 2
+
+_lock = threading.Lock()
+_loaded = {}  # index path -> (index file mtime_ns, index dict)
+
+
+def get_index_path(data_dir):
+    """
+    Return the location of the class histogram index for a data directory.
+
+    Args:
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        str: Path to the JSON index file.
+    """
+    return os.path.join(data_dir, CACHE_SUBDIR, INDEX_FILENAME)
+
+
+def get_class_stats(file_path):
+    """
+    Return the per-class pixel counts and georeferencing for a raster file.
+
+    The counts for every code in VARIABLE_CODE_MAPPING are read from a
+    persistent index next to the data. The raster is only decoded when the
+    file is missing from the index or its mtime/size no longer match.
+
+    Args:
+        file_path (str): Path to the LC_Type1 GeoTIFF.
+
+    Returns:
+        dict: {"counts": {code: pixel_count}, "areas": {code: area_km2},
+               "transform": Affine, "crs": CRS}.
+    """
+    data_dir, file_name = os.path.split(os.path.abspath(file_path))
+    index_path = get_index_path(data_dir)
+    # A list, as stored in the JSON index
+    signature = list(file_signature(file_path))
+
+    with _lock:
+        entry = _load_index(index_path)["files"].get(file_name)
+
+    if entry is None or entry["signature"] != signature:
+        entry = _build_entry(file_path, signature)
+        with _lock:
+            # Re-read so entries written by other workers meanwhile are kept
+            index = _load_index(index_path)
+            index["files"][file_name] = entry
+            _write_index(index_path, index)
+
+    return {
+        "counts": {int(code): count for code, count in entry["counts"].items()},
+        "areas": {int(code): area for code, area in entry["areas"].items()},
+        "transform": Affine(*entry["transform"]),
+        "crs": CRS.from_wkt(entry["crs"]),
+    }
+
+
+def _build_entry(file_path, signature):
+    """Decode a raster once and measure the pixel count and area of every land cover class."""
+    print(f"Indexing class counts for {file_path}")
+    if should_stream(file_path):
+        histogram, areas = stream_class_stats(file_path)
+        with rasterio.open(file_path) as src:
+            transform, crs = src.transform, src.crs
+    else:
+        raster = read_raster(file_path)
+        transform, crs = raster.transform, raster.crs
+        height, width = raster.array.shape
+        histogram, areas = class_counts_and_areas(raster.array, get_row_areas(transform, crs, height, width))
+
+    return {
+        "signature": signature,
+        "counts": {str(code): int(histogram[code]) for code in VARIABLE_CODE_MAPPING.values()},
+        "areas": {str(code): float(areas[code]) for code in VARIABLE_CODE_MAPPING.values()},
+        "transform": list(transform)[:6],
+        "crs": crs.to_wkt(),
+    }
+
+
+def _load_index(index_path):
+    """Load the index from disk, reusing the in-process copy when it is current."""
+    try:
+        mtime = os.stat(index_path).st_mtime_ns
+    except FileNotFoundError:
+        return _empty_index()
+
+    cached = _loaded.get(index_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Discarding unreadable class index {index_path}: {e}")
+        index = _empty_index()
+
+    if index.get("version") != INDEX_VERSION:
+        index = _empty_index()
+    _loaded[index_path] = (mtime, index)
+    return index
+
+
+def _write_index(index_path, index):
+    """Atomically persist the index so concurrent workers never see a partial file."""
+    with atomic_write(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    _loaded[index_path] = (os.stat(index_path).st_mtime_ns, index)
+
+
+def _empty_index():
+    return {"version": INDEX_VERSION, "files": {}}
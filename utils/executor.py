@@ -0,0 +1,48 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from utils.global_config import RASTER_EXECUTOR, RASTER_WORKERS
+
+_lock = threading.Lock()
+_executor = None
+
+
+def get_executor():
+    """
+    Return the shared worker pool configured by RASTER_EXECUTOR, creating it on first use.
+
+    Returns:
+        Executor or None: The pool, or None in serial mode.
+    """
+    global _executor
+    if RASTER_EXECUTOR == "serial" or RASTER_WORKERS <= 1:
+        return None
+    with _lock:
+        if _executor is None:
+            if RASTER_EXECUTOR == "process":
+                _executor = ProcessPoolExecutor(max_workers=RASTER_WORKERS)
+            elif RASTER_EXECUTOR == "thread":
+                # GDAL releases the GIL while decoding, so threads overlap raster reads
+                _executor = ThreadPoolExecutor(max_workers=RASTER_WORKERS, thread_name_prefix="raster")
+            else:
+                raise ValueError(f"Invalid RASTER_EXECUTOR: {RASTER_EXECUTOR}")
+        return _executor
+
+
+def map_ordered(func, *iterables):
+    """
+    Apply func over the inputs on the shared pool, returning results in input order.
+
+    The first exception, in input order, is re-raised just as a serial loop
+    would raise it. In process mode func and its arguments must be picklable.
+
+    Args:
+        func (callable): Module-level function to apply.
+        *iterables: Argument sequences, as for the built-in map.
+
+    Returns:
+        list: Results in the order of the inputs.
+    """
+    executor = get_executor()
+    if executor is None or len(iterables[0]) <= 1:
+        return list(map(func, *iterables))
+    return list(executor.map(func, *iterables))
@@ -1,3 +1,9 @@
+import os
+from dotenv import load_dotenv
+
+# Load .env before reading the environment-driven settings below
+load_dotenv()
+
 # Variables for Analysis
 VARIABLES = [
     {"value": "evergreen_needleleaf_forest", "label": "Evergreen Needleleaf Forest"},
@@ -17,6 +23,10 @@ VARIABLES = [
     {"value": "snow_and_ice", "label": "Snow and Ice"},
     {"value": "barren_or_sparsely_vegetated", "label": "Barren or Sparsely Vegetated"},
     {"value": "no_data", "label": "No Data"},
+    {"value": "all_forests", "label": "All Forests"},
+    {"value": "all_shrublands", "label": "All Shrublands"},
+    {"value": "all_savannas", "label": "All Savannas"},
+    {"value": "all_croplands", "label": "All Croplands"},
 ]
 
 # Variable to Numeric Code Mapping
@@ -40,6 +50,20 @@ VARIABLE_CODE_MAPPING = {
     "no_data": 255,
 }
 
+# Variables made of several classes, analyzed as the union of their classes
+VARIABLE_GROUPS = {
+    "all_forests": [
+        "evergreen_needleleaf_forest",
+        "evergreen_broadleaf_forest",
+        "deciduous_needleleaf_forest",
+        "deciduous_broadleaf_forest",
+        "mixed_forests",
+    ],
+    "all_shrublands": ["closed_shrublands", "open_shrublands"],
+    "all_savannas": ["woody_savannas", "savannas"],
+    "all_croplands": ["croplands", "cropland_natural_vegetation"],
+}
+
 # Supported Analysis Types and Their Expected Visualizations
 ANALYSIS_TYPES = [
     # {"value": "trend_analysis", "label": "Trend Analysis"},
@@ -69,4 +93,89 @@ VISUALIZATION_CAPTIONS = {
     "bar_chart": "Comparison of {variable} across selected years or regions.",
     "side_by_side_maps": "Side-by-side maps comparing spatial distribution of {variable} for the selected years.",
     "pie_chart": "Statistical summary of {variable} for the selected year.",
-}
\ No newline at end of file
+}
+
+# Sub-directory of the data directory holding derived artifacts (indexes, caches)
+CACHE_SUBDIR = os.getenv("CACHE_SUBDIR", ".cache")
+
+# Memory budget (bytes) of the process-wide decoded raster cache
+RASTER_CACHE_MAX_BYTES = int(os.getenv("RASTER_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Read rasters through memory-mapped uncompressed copies instead of decoding the GeoTIFFs
+RASTER_STORE_ENABLED = os.getenv("RASTER_STORE_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Rasters with more pixels than this are reduced block by block instead of decoded whole
+STREAMING_MIN_PIXELS = int(os.getenv("STREAMING_MIN_PIXELS", 256 * 1024 * 1024))
+
+# Per-year raster processing: "thread", "process" or "serial", and the pool size
+RASTER_EXECUTOR = os.getenv("RASTER_EXECUTOR", "thread")
+RASTER_WORKERS = int(os.getenv("RASTER_WORKERS", min(8, os.cpu_count() or 1)))
+
+# Maximum number of years accepted in a single /chat request
+MAX_QUERY_YEARS = int(os.getenv("MAX_QUERY_YEARS", len(YEARS)))
+
+# Serve the web map as XYZ tiles from /tiles instead of one embedded PNG overlay
+MAP_TILES_ENABLED = os.getenv("MAP_TILES_ENABLED", "true").lower() in ("1", "true", "yes")
+TILE_CACHE_MAX_ENTRIES = int(os.getenv("TILE_CACHE_MAX_ENTRIES", 4096))
+# Deepest zoom level served; requests beyond it get a 404
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", 12))
+# Disk budget (bytes) of rendered tiles; the least recently used are deleted beyond it
+TILE_DISK_CACHE_MAX_BYTES = int(os.getenv("TILE_DISK_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# Cache of /chat statistics and visualizations: lifetime in seconds and entry bound
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 256))
+
+# Language model used for the analysis summary; LLM_BASE_URL points the client at
+# any OpenAI-compatible server (e.g. a local stub for tests and benchmarks)
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+
+# Persistent cache of generated summaries, keyed on a hash of the prompt and model parameters:
+# location, lifetime in seconds and budget (bytes of stored text)
+SUMMARY_CACHE_ENABLED = os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", CACHE_SUBDIR, "summaries.sqlite3"
+)
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", 7 * 24 * 3600))
+SUMMARY_CACHE_MAX_BYTES = int(os.getenv("SUMMARY_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Serve an expired cached summary when the model times out; expired entries are kept this
+# many seconds past their TTL for that purpose
+SUMMARY_FALLBACK_ON_TIMEOUT = os.getenv("SUMMARY_FALLBACK_ON_TIMEOUT", "true").lower() in ("1", "true", "yes")
+SUMMARY_CACHE_STALE_TTL = int(os.getenv("SUMMARY_CACHE_STALE_TTL", 30 * 24 * 3600))
+
+# Memory budget (bytes) of the bit-packed rasterized region masks kept for zonal statistics
+ZONAL_MASK_CACHE_MAX_BYTES = int(os.getenv("ZONAL_MASK_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Pixels needed along the longest side of the raster for static charts and the map
+# overlay; rendering uses the coarsest overview level that still has this many
+CHART_RASTER_SIZE = int(os.getenv("CHART_RASTER_SIZE", 1600))
+MAP_OVERLAY_SIZE = int(os.getenv("MAP_OVERLAY_SIZE", 2048))
+
+# Browser cache lifetime of content-addressed artifacts served from /artifacts, in seconds
+ARTIFACT_MAX_AGE = int(os.getenv("ARTIFACT_MAX_AGE", 365 * 24 * 3600))
+
+# Disk budget (bytes) of stored artifacts; the least recently stored are deleted beyond it
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Record per-stage timings, counters and cache statistics and expose them on /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Directory where every server process writes its metrics so /metrics can merge them across
+# Gunicorn workers; empty to report only the process answering the scrape
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", CACHE_SUBDIR, "metrics"
+))
+
+# Load the analysis stack and the class indexes in the Gunicorn master before workers fork
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Watch the data directory from every server process and precompute the derived data of new
+# or replaced rasters: seconds between scans, files processed at once and deepest tile zoom
+# rendered ahead (-1 for none). `python -m utils.precompute --watch` does the same standalone
+PRECOMPUTE_ENABLED = os.getenv("PRECOMPUTE_ENABLED", "false").lower() in ("1", "true", "yes")
+PRECOMPUTE_INTERVAL = float(os.getenv("PRECOMPUTE_INTERVAL", 30))
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", 2))
+PRECOMPUTE_TILE_MAX_ZOOM = int(os.getenv("PRECOMPUTE_TILE_MAX_ZOOM", 2))
@@ -0,0 +1,102 @@
+import os
+import threading
+from utils.global_config import LLM_MODEL, LLM_BASE_URL, LLM_TIMEOUT
+
+_lock = threading.Lock()
+_client = None
+
+
+def get_llm_client():
+    """
+    Return the process-wide OpenAI client, creating it on first use.
+
+    The client keeps its HTTP connection pool between requests. Point
+    LLM_BASE_URL at any OpenAI-compatible server to swap the backend.
+
+    Returns:
+        openai.OpenAI: Shared client.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            # Importing openai takes a large share of startup time; defer it to the first call
+            import openai
+            _client = openai.OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY") or "unused",
+                base_url=LLM_BASE_URL,
+                timeout=LLM_TIMEOUT,
+            )
+        return _client
+
+
+def set_llm_client(client):
+    """
+    Replace the shared client, e.g. with a stub exposing chat.completions.create.
+
+    Args:
+        client: Object compatible with openai.OpenAI, or None to recreate the default.
+    """
+    global _client
+    with _lock:
+        _client = client
+
+
+def is_timeout(error):
+    """
+    Tell whether an exception raised by the client is a request timeout.
+
+    Args:
+        error (BaseException): Exception raised by complete or stream.
+
+    Returns:
+        bool: True for client and socket timeouts.
+    """
+    if isinstance(error, TimeoutError):
+        return True
+    import openai
+    return isinstance(error, openai.APITimeoutError)
+
+
+def complete(messages, max_tokens=400, temperature=0.7):
+    """
+    Run a chat completion and return the full response text.
+
+    Args:
+        messages (list): Chat messages.
+        max_tokens (int): Maximum tokens to generate.
+        temperature (float): Sampling temperature.
+
+    Returns:
+        str: Generated text.
+    """
+    response = get_llm_client().chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+    )
+    return response.choices[0].message.content
+
+
+def stream(messages, max_tokens=400, temperature=0.7):
+    """
+    Run a chat completion and yield the text as it is generated.
+
+    Args:
+        messages (list): Chat messages.
+        max_tokens (int): Maximum tokens to generate.
+        temperature (float): Sampling temperature.
+
+    Yields:
+        str: Text fragments in generation order.
+    """
+    chunks = get_llm_client().chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+    )
+    for chunk in chunks:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
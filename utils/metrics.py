@@ -0,0 +1,360 @@
+import os
+import re
+import json
+import time
+import bisect
+import threading
+import functools
+from utils.global_config import METRICS_ENABLED, METRICS_DIR
+from utils.cache_util import atomic_write
+
+# Prefix of every exported metric name
+NAMESPACE = "landcover"
+
+# Upper bounds in seconds of the duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+_counters = {}  # (name, labels) -> value
+_help = {}  # name -> help text
+_collectors = []  # callables returning samples computed at scrape time
+
+# Seconds between writes of this process's metrics to METRICS_DIR
+FLUSH_INTERVAL = 5
+# Per-process files in METRICS_DIR; anything else there is ignored
+PROCESS_FILE = re.compile(r"^(\d+)\.json$")
+_forked = False  # True in processes forked after this module was imported, e.g. Gunicorn workers
+_flusher_pid = None  # process whose flush thread is running
+
+
+class _Span:
+    """Times a block of code and records it in the stage duration histogram."""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe("stage_duration_seconds", time.perf_counter() - self.start, stage=self.stage)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage):
+    """
+    Return a context manager timing one pipeline stage.
+
+    Durations go to the landcover_stage_duration_seconds histogram labelled
+    with the stage name. When metrics are disabled a shared no-op context is
+    returned.
+
+    Args:
+        stage (str): Stage name, e.g. "read_raster_data".
+
+    Returns:
+        Context manager.
+    """
+    return _Span(stage) if METRICS_ENABLED else _NOOP_SPAN
+
+
+def timed(stage):
+    """
+    Decorate a function so every call is recorded as a span.
+
+    When metrics are disabled the function is returned unchanged.
+
+    Args:
+        stage (str): Stage name.
+
+    Returns:
+        callable: Decorator.
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe(name, value, **labels):
+    """
+    Record one value in a duration histogram.
+
+    Args:
+        name (str): Metric name without the namespace prefix.
+        value (float): Observed value in seconds.
+        **labels: Label values.
+    """
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(DURATION_BUCKETS, value)
+    _ensure_flusher()
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(DURATION_BUCKETS) + 1), 0.0, 0]
+        histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def increment(name, value=1, **labels):
+    """
+    Add to a counter.
+
+    Args:
+        name (str): Metric name without the namespace prefix, ending in _total.
+        value (int or float): Amount to add.
+        **labels: Label values.
+    """
+    if not METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    _ensure_flusher()
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def describe(name, help_text):
+    """
+    Set the HELP text of a metric.
+
+    Args:
+        name (str): Metric name without the namespace prefix.
+        help_text (str): One-line description.
+    """
+    _help[name] = help_text
+
+
+def register_collector(collector):
+    """
+    Register a function whose samples are read at every scrape.
+
+    Used for values that already live elsewhere, such as cache statistics.
+
+    Args:
+        collector (callable): Returns a list of (name, type, labels dict, value)
+            tuples, where type is "counter" or "gauge".
+    """
+    with _lock:
+        _collectors.append(collector)
+
+
+def snapshot():
+    """
+    Return the metrics recorded by this process.
+
+    Returns:
+        dict: {"histograms": {(name, labels): (bucket counts, sum, count)},
+               "counters": {(name, labels): value},
+               "samples": [(name, type, labels, value)] read from the collectors}.
+    """
+    with _lock:
+        histograms = {key: (list(h[0]), h[1], h[2]) for key, h in _histograms.items()}
+        counters = dict(_counters)
+        collectors = list(_collectors)
+    samples = []
+    for collector in collectors:
+        for name, metric_type, labels, value in collector():
+            samples.append((name, metric_type, tuple(sorted(labels.items())), value))
+    return {"histograms": histograms, "counters": counters, "samples": samples}
+
+
+def render_prometheus():
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    With METRICS_DIR set, the metrics of every server process are merged:
+    histograms and counters are summed over all processes that ever wrote
+    to the directory, so they never go backwards when another worker
+    answers the scrape, and collector samples of the live processes are
+    reported with a pid label.
+
+    Returns:
+        str: Metrics text.
+    """
+    if METRICS_DIR:
+        flush()
+        merged = _merge_snapshots()
+    else:
+        merged = snapshot()
+
+    families = {}  # name -> (type, [(suffix, labels, value)])
+    for (name, labels), (buckets, total, count) in sorted(merged["histograms"].items()):
+        samples = families.setdefault(name, ("histogram", []))[1]
+        cumulative = 0
+        for bound, bucket_count in zip(DURATION_BUCKETS + (float("inf"),), buckets):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            samples.append(("_bucket", labels + (("le", le),), cumulative))
+        samples.append(("_sum", labels, total))
+        samples.append(("_count", labels, count))
+
+    for (name, labels), value in sorted(merged["counters"].items()):
+        families.setdefault(name, ("counter", []))[1].append(("", labels, value))
+
+    for name, metric_type, labels, value in merged["samples"]:
+        families.setdefault(name, (metric_type, []))[1].append(("", labels, value))
+
+    lines = []
+    for name, (metric_type, samples) in families.items():
+        full_name = f"{NAMESPACE}_{name}"
+        if name in _help:
+            lines.append(f"# HELP {full_name} {_help[name]}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        for suffix, labels, value in samples:
+            lines.append(f"{full_name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def flush():
+    """Write this process's metrics to METRICS_DIR for the process answering /metrics."""
+    if not METRICS_DIR:
+        return
+    data = snapshot()
+    payload = {
+        "histograms": [[name, labels, *values] for (name, labels), values in data["histograms"].items()],
+        "counters": [[name, labels, value] for (name, labels), value in data["counters"].items()],
+        "samples": data["samples"],
+    }
+    with atomic_write(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+
+
+def clear_directory():
+    """Remove the metrics files of earlier server runs; call once before workers start."""
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return
+    for name in os.listdir(METRICS_DIR):
+        if PROCESS_FILE.match(name):
+            os.remove(os.path.join(METRICS_DIR, name))
+
+
+def _after_fork_in_child():
+    """Give a forked child its own lock and an empty registry."""
+    global _lock, _forked
+    # Another thread of the parent may have held the lock at the time of the fork
+    _lock = threading.Lock()
+    # The parent reports what it recorded itself; counting it again here would double it
+    _histograms.clear()
+    _counters.clear()
+    _forked = True
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _ensure_flusher():
+    """Start the periodic flush once per forked process; the master and single processes flush on demand."""
+    global _flusher_pid
+    if not _forked or not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, name="metrics-flush", daemon=True).start()
+
+
+def _flush_periodically():
+    pid = os.getpid()
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        if os.getpid() != pid:
+            return
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _merge_snapshots():
+    """Sum the histograms and counters of every process file and collect live processes' samples."""
+    histograms, counters, samples = {}, {}, []
+    for file_name in sorted(os.listdir(METRICS_DIR)):
+        match = PROCESS_FILE.match(file_name)
+        if match is None:
+            continue
+        pid = int(match.group(1))
+        try:
+            with open(os.path.join(METRICS_DIR, file_name), encoding="utf-8") as f:
+                data = json.load(f)
+            # Parse the whole file before merging, so a malformed one is skipped entirely
+            file_histograms = [
+                ((name, tuple(tuple(label) for label in labels)), list(buckets), total, count)
+                for name, labels, buckets, total, count in data["histograms"]
+            ]
+            file_counters = [
+                ((name, tuple(tuple(label) for label in labels)), value) for name, labels, value in data["counters"]
+            ]
+            file_samples = [
+                (name, metric_type, tuple(tuple(label) for label in labels) + (("pid", str(pid)),), value)
+                for name, metric_type, labels, value in data["samples"]
+            ]
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        for key, buckets, total, count in file_histograms:
+            merged = histograms.setdefault(key, ([0] * len(buckets), 0.0, 0))
+            histograms[key] = ([a + b for a, b in zip(merged[0], buckets)], merged[1] + total, merged[2] + count)
+        for key, value in file_counters:
+            counters[key] = counters.get(key, 0) + value
+        if _is_alive(pid):
+            samples.extend(file_samples)
+    return {"histograms": histograms, "counters": counters, "samples": samples}
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+describe("stage_duration_seconds", "Duration of pipeline stages.")
+describe("http_request_duration_seconds", "Duration of HTTP requests by endpoint.")
+describe("raster_bytes_read_total", "Bytes of raster data decoded, by kind of read.")
+describe("cache_hits_total", "Cache lookups served from the cache.")
+describe("cache_misses_total", "Cache lookups that had to compute or load the value.")
@@ -0,0 +1,104 @@
+import os
+import math
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from utils.global_config import CACHE_SUBDIR
+from utils.raster_cache import RasterEntry, read_raster, read_raster_variant
+from utils.cache_util import file_signature, atomic_write
+from utils import metrics
+
+# Decimation factors of the pyramid built for rasters without internal overviews
+PYRAMID_FACTORS = (2, 4, 8, 16, 32, 64)
+
+
+def pick_factor(width, height, factors, target_size):
+    """
+    Return the coarsest decimation factor that keeps at least target_size pixels on the longest side.
+
+    Args:
+        width (int): Full-resolution width.
+        height (int): Full-resolution height.
+        factors (list): Available decimation factors.
+        target_size (int): Pixels needed along the longest side.
+
+    Returns:
+        int: Chosen factor, 1 for full resolution.
+    """
+    chosen = 1
+    for factor in sorted(factors):
+        if max(math.ceil(width / factor), math.ceil(height / factor)) >= target_size:
+            chosen = factor
+    return chosen
+
+
+@metrics.timed("read_for_display")
+def read_for_display(file_path, target_size):
+    """
+    Read the smallest resolution level of a raster that is adequate for rendering.
+
+    The level comes from the COG's internal overviews when present, otherwise
+    from a mode-resampled pyramid level built once and persisted next to the
+    data. Levels are shared through the process-wide raster cache.
+
+    Args:
+        file_path (str): Path to the raster file.
+        target_size (int): Pixels needed along the longest side of the output.
+
+    Returns:
+        RasterEntry: Read-only array, transform and CRS of the chosen level.
+    """
+    with rasterio.open(file_path) as src:
+        width, height = src.width, src.height
+        internal = src.overviews(1)
+
+    factor = pick_factor(width, height, internal or PYRAMID_FACTORS, target_size)
+    if factor == 1:
+        return read_raster(file_path)
+    if internal:
+        level = internal.index(factor)
+        return read_raster_variant(file_path, ("overview", factor), lambda path: _read_overview(path, level))
+    return read_raster_variant(file_path, ("pyramid", factor), lambda path: _read_pyramid(path, factor))
+
+
+def _read_overview(file_path, level):
+    """Decode one internal overview level of a GeoTIFF."""
+    with rasterio.open(file_path) as src:
+        transform, crs = src.transform, src.crs
+        width, height = src.width, src.height
+    with rasterio.open(file_path, OVERVIEW_LEVEL=level) as overview:
+        array = overview.read(1)
+    metrics.increment("raster_bytes_read_total", array.nbytes, read="overview")
+    scale = Affine.scale(width / array.shape[1], height / array.shape[0])
+    return RasterEntry(array, transform * scale, crs)
+
+
+def _read_pyramid(file_path, factor):
+    """Load a persisted mode-resampled level, building it on first use."""
+    mtime_ns, size = file_signature(file_path)
+    data_dir, file_name = os.path.split(os.path.abspath(file_path))
+    level_path = os.path.join(
+        data_dir, CACHE_SUBDIR, "pyramid",
+        f"{os.path.splitext(file_name)[0]}-{mtime_ns}-{size}-x{factor}.npy",
+    )
+
+    with rasterio.open(file_path) as src:
+        transform, crs = src.transform, src.crs
+        width, height = src.width, src.height
+        if os.path.exists(level_path):
+            array = np.load(level_path)
+        else:
+            # Mode resampling keeps the dominant class of each block, as is correct for categories
+            print(f"Building x{factor} pyramid level for {file_path}")
+            array = src.read(
+                1,
+                out_shape=(math.ceil(height / factor), math.ceil(width / factor)),
+                resampling=Resampling.mode,
+            )
+            metrics.increment("raster_bytes_read_total", width * height, read="pyramid")
+            with atomic_write(level_path) as f:
+                np.save(f, array)
+
+    scale = Affine.scale(width / array.shape[1], height / array.shape[0])
+    return RasterEntry(array, transform * scale, crs)
@@ -0,0 +1,97 @@
+import threading
+import numpy as np
+import pyproj
+
+# Projection methods that preserve area, so every pixel covers the same ground area
+EQUAL_AREA_METHODS = {"sinusoidal", "mollweide", "equal earth", "interrupted goode homolosine"}
+
+# Rows reduced per bincount call in class_counts_and_areas
+CHUNK_ROWS = 512
+
+_lock = threading.Lock()
+_row_areas = {}  # (transform, crs wkt, height, width) -> row area vector
+
+
+def get_row_areas(transform, crs, height, width):
+    """
+    Return the ground area of one pixel in each row of a raster grid.
+
+    For geographic CRSs every pixel in a row has the same area, which shrinks
+    with latitude. For equal-area projections the area is the constant cell
+    size. Other projections use the pixel at the centre column of each row.
+    Vectors are cached per grid.
+
+    Args:
+        transform (Affine): Transform of the grid.
+        crs (CRS): CRS of the grid.
+        height (int): Number of rows.
+        width (int): Number of columns.
+
+    Returns:
+        np.ndarray: float64 vector of length height with pixel areas in km².
+    """
+    key = (tuple(transform)[:6], crs.to_wkt(), height, width)
+    with _lock:
+        cached = _row_areas.get(key)
+    if cached is not None:
+        return cached
+
+    source_crs = pyproj.CRS.from_wkt(crs.to_wkt())
+    method = source_crs.coordinate_operation.method_name.lower() if source_crs.coordinate_operation else ""
+    if not source_crs.is_geographic and (method in EQUAL_AREA_METHODS or "equal area" in method):
+        unit = source_crs.axis_info[0].unit_conversion_factor
+        cell_area = abs(transform.a * transform.e - transform.b * transform.d) * unit ** 2 / 1e6
+        row_areas = np.full(height, cell_area, dtype=np.float64)
+    else:
+        row_areas = _geodesic_row_areas(transform, source_crs, height, width)
+    row_areas.flags.writeable = False
+
+    with _lock:
+        _row_areas[key] = row_areas
+    return row_areas
+
+
+def class_counts_and_areas(array, row_areas):
+    """
+    Count the pixels and ground area of every class code in a raster block.
+
+    Pixels are counted per row and combined as counts_per_row @ row_areas,
+    so the areas follow the latitude-dependent pixel size.
+
+    Args:
+        array (np.ndarray): 2-D uint8 class codes.
+        row_areas (np.ndarray): Pixel area in km² for each row of the block.
+
+    Returns:
+        tuple: (int64 histogram of length 256, float64 areas in km² of length 256).
+    """
+    histogram = np.zeros(256, dtype=np.int64)
+    areas = np.zeros(256, dtype=np.float64)
+    for row in range(0, array.shape[0], CHUNK_ROWS):
+        chunk = array[row:row + CHUNK_ROWS]
+        rows = chunk.shape[0]
+        keys = np.arange(rows, dtype=np.intp)[:, None] * 256 + chunk
+        counts_per_row = np.bincount(keys.ravel(), minlength=rows * 256).reshape(rows, 256)
+        histogram += counts_per_row.sum(axis=0)
+        areas += row_areas[row:row + rows] @ counts_per_row
+    return histogram, areas
+
+
+def _geodesic_row_areas(transform, source_crs, height, width):
+    """Measure one pixel per row on the CRS's ellipsoid."""
+    geod = source_crs.get_geod()
+    to_lonlat = None
+    if not source_crs.is_geographic:
+        to_lonlat = pyproj.Transformer.from_crs(source_crs, source_crs.geodetic_crs, always_xy=True)
+
+    col = width // 2
+    row_areas = np.empty(height, dtype=np.float64)
+    for row in range(height):
+        corners = [transform * (col, row), transform * (col + 1, row),
+                   transform * (col + 1, row + 1), transform * (col, row + 1)]
+        xs, ys = zip(*corners)
+        if to_lonlat is not None:
+            xs, ys = to_lonlat.transform(xs, ys)
+        area, _ = geod.polygon_area_perimeter(xs, ys)
+        row_areas[row] = abs(area) / 1e6
+    return row_areas
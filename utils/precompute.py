@@ -0,0 +1,339 @@
+import os
+import sys
+import glob
+import json
+import time
+import fcntl
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from utils.global_config import (
+    YEARS, VARIABLE_CODE_MAPPING, CACHE_SUBDIR, CHART_RASTER_SIZE, MAP_OVERLAY_SIZE, MAP_TILES_ENABLED,
+    PRECOMPUTE_INTERVAL, PRECOMPUTE_WORKERS, PRECOMPUTE_TILE_MAX_ZOOM, TILE_MAX_ZOOM,
+)
+from utils.cache_util import file_signature, atomic_write
+from utils import metrics
+
+STATUS_FILENAME = "precompute_status.json"
+
+# Files modified more recently than this are assumed to still be copying in
+SETTLE_SECONDS = 5
+
+_lock = threading.Lock()
+_watcher = None
+
+
+class Precomputer:
+    """
+    Warm the derived data of every raster in a data directory, and of new or replaced ones.
+
+    Each pass scans the directory for LC_Type1_{year}.tif files of the years in
+    YEARS and processes those not seen with their current mtime and size, at
+    most `workers` files at a time. Per file it builds the class counts, the
+    overview levels used for rendering, and for every class of
+    VARIABLE_CODE_MAPPING the packed mask, the low-zoom map tiles and, with
+    warm_memory, the default spatial_distribution statistics and
+    visualizations, pinned in this process's response cache so they do not
+    expire. The trajectory cube is rebuilt once the files are done.
+
+    Disk artifacts are shared between processes; a per-file lock lets
+    several server workers watch the same directory without building them twice.
+    Progress is kept in memory and written to data/.cache/precompute_status.json.
+    """
+
+    def __init__(self, data_dir, workers=PRECOMPUTE_WORKERS, interval=PRECOMPUTE_INTERVAL,
+                 variables=None, tile_max_zoom=PRECOMPUTE_TILE_MAX_ZOOM, warm_memory=False):
+        self.data_dir = data_dir
+        self.workers = workers
+        self.interval = interval
+        self.variables = list(variables or VARIABLE_CODE_MAPPING)
+        self.tile_max_zoom = tile_max_zoom
+        # Only worth it in a process that serves requests
+        self.warm_memory = warm_memory
+        self._done = {}  # file name -> signature processed (or failed)
+        self._files = {}  # file name -> progress dict
+        self._state = "idle"
+        self._last_scan = None
+        self._status_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run passes in a daemon thread every `interval` seconds until stop is called."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="precompute", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Ask the watcher thread to exit after the current pass and wait for it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logging.exception("Precompute pass failed")
+            self._stop.wait(self.interval)
+
+    def scan(self, settle=True):
+        """
+        Return the rasters that are new or changed since they were last processed.
+
+        Args:
+            settle (bool): Skip files modified in the last SETTLE_SECONDS.
+
+        Returns:
+            list: (file name, path, signature) tuples in year order.
+        """
+        pending = []
+        for path in sorted(glob.glob(os.path.join(self.data_dir, "LC_Type1_*.tif"))):
+            name = os.path.basename(path)
+            year = name[len("LC_Type1_"):-len(".tif")]
+            if not year.isdigit() or int(year) not in YEARS:
+                continue
+            try:
+                signature = file_signature(path)
+            except FileNotFoundError:
+                continue
+            if settle and time.time() - signature[0] / 1e9 < SETTLE_SECONDS:
+                continue
+            if self._done.get(name) != signature:
+                pending.append((name, path, signature))
+        self._last_scan = time.time()
+        return pending
+
+    def run_once(self, settle=True):
+        """
+        Process every new or changed raster, then refresh the trajectory cube.
+
+        Args:
+            settle (bool): Skip files still being written, as in scan.
+
+        Returns:
+            int: Number of files processed.
+        """
+        pending = self.scan(settle)
+        if not pending:
+            return 0
+
+        with self._status_lock:
+            self._state = "running"
+            for name, path, signature in pending:
+                self._files[name] = {
+                    "state": "pending", "signature": signature, "done": 0,
+                    "total": None, "step": None, "error": None, "seconds": None,
+                }
+        self._write_status()
+
+        with metrics.span("precompute"):
+            if self.workers <= 1 or len(pending) == 1:
+                for name, path, signature in pending:
+                    self._process(name, path, signature)
+            else:
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="precompute") as executor:
+                    list(executor.map(lambda item: self._process(*item), pending))
+
+            # The cube spans every year, so it is rebuilt once per pass
+            if len(self._done) >= 2:
+                from utils.trajectory import get_trajectory_cube
+                try:
+                    get_trajectory_cube(self.data_dir)
+                except Exception:
+                    logging.exception("Precomputing the trajectory cube failed")
+
+        with self._status_lock:
+            self._state = "idle"
+        self._write_status()
+        return len(pending)
+
+    def _tiles_enabled(self):
+        return MAP_TILES_ENABLED and self.tile_max_zoom >= 0
+
+    def _process(self, name, path, signature):
+        """Precompute one raster, recording progress and failures in the status."""
+        start = time.perf_counter()
+        self._update(name, state="running")
+        try:
+            steps = self._steps(path)
+            self._update(name, total=len(steps))
+            with _file_lock(self.data_dir, name):
+                for done, (step, run) in enumerate(steps, 1):
+                    self._update(name, step=step)
+                    run()
+                    self._update(name, done=done)
+        except Exception as e:
+            logging.exception(f"Precomputing {name} failed")
+            self._update(name, state="failed", error=str(e), seconds=round(time.perf_counter() - start, 2))
+            metrics.increment("precompute_files_total", result="failed")
+        else:
+            self._update(name, state="done", step=None, seconds=round(time.perf_counter() - start, 2))
+            metrics.increment("precompute_files_total", result="done")
+            print(f"Precomputed {name} in {time.perf_counter() - start:.1f}s")
+        # Failed files are retried once they change
+        self._done[name] = signature
+
+    def _steps(self, path):
+        """Return the (name, zero-argument function) precompute steps of one raster."""
+        from utils.class_index import get_class_stats
+        from utils.overviews import read_for_display
+        from utils.bitmask_index import get_class_bits
+        from utils.analysis import get_analysis_result
+
+        year = os.path.basename(path)[len("LC_Type1_"):-len(".tif")]
+        steps = [
+            ("class_stats", lambda: get_class_stats(path)),
+            ("overviews", lambda: [read_for_display(path, size) for size in (CHART_RASTER_SIZE, MAP_OVERLAY_SIZE)]),
+        ]
+        for variable in self.variables:
+            query = {"intent": "spatial_distribution", "variables": variable, "years": [year],
+                     "comments": "", "region": None}
+            steps.append((f"bitmask:{variable}", lambda code=VARIABLE_CODE_MAPPING[variable]: get_class_bits(path, code)))
+            if self.warm_memory:
+                pin = ("precompute", os.path.abspath(self.data_dir), year, variable)
+                steps.append((f"visualizations:{variable}",
+                              lambda query=query, pin=pin: get_analysis_result(query, self.data_dir, pin)))
+            if self._tiles_enabled():
+                steps.append((f"tiles:{variable}", lambda variable=variable: self._render_tiles(year, variable)))
+        return steps
+
+    def _render_tiles(self, year, variable):
+        """Render the tiles of one class up to tile_max_zoom into the tile caches."""
+        from utils.tiles import get_tile
+
+        for z in range(min(self.tile_max_zoom, TILE_MAX_ZOOM) + 1):
+            for x in range(2 ** z):
+                for y in range(2 ** z):
+                    get_tile(year, variable, z, x, y, self.data_dir)
+
+    def _update(self, name, **fields):
+        with self._status_lock:
+            self._files[name].update(fields)
+        self._write_status()
+
+    def status(self):
+        """
+        Return the progress of the watcher.
+
+        Returns:
+            dict: {"state": "idle" or "running", "pid", "last_scan": epoch seconds,
+                   "files": {file name: {"state", "done", "total", "step", "error", "seconds", ...}}}.
+        """
+        with self._status_lock:
+            return {
+                "state": self._state,
+                "pid": os.getpid(),
+                "last_scan": self._last_scan,
+                "files": {name: dict(progress) for name, progress in self._files.items()},
+            }
+
+    def _write_status(self):
+        with atomic_write(get_status_path(self.data_dir), "w", encoding="utf-8") as f:
+            json.dump(self.status(), f)
+
+
+def get_status_path(data_dir):
+    """
+    Return the location of the precompute progress file for a data directory.
+
+    Args:
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        str: Path to the JSON status file.
+    """
+    return os.path.join(data_dir, CACHE_SUBDIR, STATUS_FILENAME)
+
+
+def load_status(data_dir):
+    """
+    Return the progress of the precompute watcher serving a data directory.
+
+    The in-process watcher is reported when running, otherwise the status last
+    written by any watcher, including the CLI worker.
+
+    Args:
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        dict or None: Status as returned by Precomputer.status, or None if nothing ran yet.
+    """
+    with _lock:
+        watcher = _watcher
+    if watcher is not None and os.path.abspath(watcher.data_dir) == os.path.abspath(data_dir):
+        return watcher.status()
+    try:
+        with open(get_status_path(data_dir), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def start_watcher(data_dir):
+    """
+    Start the process-wide precompute watcher for a data directory, once.
+
+    Must run after forking (e.g. in a Gunicorn post_fork hook), since threads
+    do not survive a fork, and only in processes that serve requests, since
+    the watcher also warms this process's response cache.
+
+    Args:
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        Precomputer: The running watcher.
+    """
+    global _watcher
+    with _lock:
+        if _watcher is None:
+            _watcher = Precomputer(data_dir, warm_memory=True)
+            _watcher.start()
+        return _watcher
+
+
+@contextmanager
+def _file_lock(data_dir, name):
+    """Hold an exclusive inter-process lock on one raster's precompute work."""
+    lock_path = os.path.join(data_dir, CACHE_SUBDIR, "precompute", f"{name}.lock")
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute derived data for new or changed rasters.")
+    parser.add_argument("data_dir", nargs="?", default="data", help="Directory containing the rasters.")
+    parser.add_argument("--watch", action="store_true", help="Keep polling the directory for changes.")
+    parser.add_argument("--interval", type=float, default=PRECOMPUTE_INTERVAL, help="Seconds between scans.")
+    parser.add_argument("--workers", type=int, default=PRECOMPUTE_WORKERS, help="Files processed concurrently.")
+    parser.add_argument("--variables", nargs="*", choices=list(VARIABLE_CODE_MAPPING),
+                        help="Classes to render (default: all).")
+    args = parser.parse_args(argv)
+
+    precomputer = Precomputer(args.data_dir, workers=args.workers, interval=args.interval, variables=args.variables)
+    if not args.watch:
+        count = precomputer.run_once(settle=False)
+        failed = [name for name, progress in precomputer.status()["files"].items() if progress["state"] == "failed"]
+        print(f"Precomputed {count - len(failed)} of {count} files", file=sys.stderr)
+        return 1 if failed else 0
+
+    precomputer.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        precomputer.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    # Usage: python -m utils.precompute [data_dir] [--watch] [--workers 2] [--interval 30]
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+import rasterio
+from utils.global_config import RASTER_CACHE_MAX_BYTES, RASTER_STORE_ENABLED
+from utils.raster_store import open_materialized
+from utils.cache_util import file_signature, single_flight
+from utils import metrics
+
+# Decoded band 1 of a raster together with its georeferencing
+RasterEntry = namedtuple("RasterEntry", ["array", "transform", "crs"])
+
+
+class RasterCache:
+    """
+    Process-wide LRU cache of decoded rasters bounded by a byte budget.
+
+    Entries are keyed on (path, mtime, size) so a replaced file is decoded again,
+    and the cached arrays are read-only because they are shared between
+    requests.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, file_path, loader, variant=None):
+        """
+        Return the cached entry for a file, decoding it with loader on a miss.
+
+        Args:
+            file_path (str): Path to the raster file.
+            loader (callable): Function taking the path and returning a RasterEntry.
+            variant (hashable, optional): Distinguishes derived versions of the
+                same file, such as overview levels.
+
+        Returns:
+            RasterEntry: Decoded array, transform and CRS.
+        """
+        key = (os.path.abspath(file_path), file_signature(file_path), variant)
+
+        def lookup():
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return entry
+
+        def load():
+            with self._lock:
+                self.misses += 1
+            entry = loader(file_path)
+            entry.array.flags.writeable = False
+            with self._lock:
+                self._insert(key, entry)
+            return entry
+
+        return single_flight(self._lock, self._loading, key, lookup, load)
+
+    def _insert(self, key, entry):
+        size = _entry_size(entry)
+        # Drop older versions of the same file and variant
+        for stale_key in [k for k in self._entries if k[0] == key[0] and k[2] == key[2]]:
+            self._remove(stale_key)
+        if size > self.max_bytes:
+            return
+        while self.current_bytes + size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        self._entries[key] = entry
+        self.current_bytes += size
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.current_bytes -= _entry_size(entry)
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: Hits, misses, evictions, entry count and memory usage.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _entry_size(entry):
+    """Memory-mapped arrays live in the shared OS page cache and cost no heap memory."""
+    if isinstance(entry.array, np.memmap):
+        return 0
+    return entry.array.nbytes
+
+
+def _decode_band(file_path):
+    """Decode band 1 of a GeoTIFF into memory."""
+    print(f"Decoding raster {file_path}")
+    with metrics.span("raster_decode"), rasterio.open(file_path) as src:
+        array = src.read(1)
+        metrics.increment("raster_bytes_read_total", array.nbytes, read="full")
+        return RasterEntry(array, src.transform, src.crs)
+
+
+def _map_materialized(file_path):
+    """Memory-map the uncompressed copy of a GeoTIFF without decoding it."""
+    return RasterEntry(*open_materialized(file_path))
+
+
+_cache = RasterCache(RASTER_CACHE_MAX_BYTES)
+
+
+def _collect_cache_stats():
+    stats = _cache.stats()
+    return [
+        ("cache_hits_total", "counter", {"cache": "raster"}, stats["hits"]),
+        ("cache_misses_total", "counter", {"cache": "raster"}, stats["misses"]),
+        ("cache_evictions_total", "counter", {"cache": "raster"}, stats["evictions"]),
+        ("cache_entries", "gauge", {"cache": "raster"}, stats["entries"]),
+        ("cache_bytes", "gauge", {"cache": "raster"}, stats["bytes"]),
+    ]
+
+
+metrics.register_collector(_collect_cache_stats)
+
+
+def read_raster(file_path):
+    """
+    Read band 1 of a raster through the shared process-wide cache.
+
+    Args:
+        file_path (str): Path to the raster file.
+
+    Returns:
+        RasterEntry: Read-only uint8 array (a memmap in materialized store mode), transform and CRS.
+    """
+    loader = _map_materialized if RASTER_STORE_ENABLED else _decode_band
+    return _cache.get(file_path, loader)
+
+
+def get_cache_stats():
+    """
+    Return hit/miss/eviction counters of the shared raster cache.
+
+    Returns:
+        dict: Cache statistics.
+    """
+    return _cache.stats()
+
+
+def read_raster_variant(file_path, variant, loader):
+    """
+    Read a derived version of a raster (e.g. an overview level) through the shared cache.
+
+    Args:
+        file_path (str): Path to the source raster file.
+        variant (hashable): Identifies the derived version.
+        loader (callable): Function taking the path and returning a RasterEntry.
+
+    Returns:
+        RasterEntry: Read-only array, transform and CRS of the variant.
+    """
+    return _cache.get(file_path, loader, variant)
@@ -0,0 +1,95 @@
+import os
+import sys
+import glob
+import json
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from utils.global_config import CACHE_SUBDIR
+from utils.cache_util import file_signature, atomic_write
+
+STORE_SUBDIR = "store"
+
+
+def get_store_paths(file_path):
+    """
+    Return the locations of the materialized array and its sidecar for a GeoTIFF.
+
+    Args:
+        file_path (str): Path to the source GeoTIFF.
+
+    Returns:
+        tuple: (array path, sidecar path).
+    """
+    data_dir, file_name = os.path.split(os.path.abspath(file_path))
+    base = os.path.join(data_dir, CACHE_SUBDIR, STORE_SUBDIR, os.path.splitext(file_name)[0])
+    return f"{base}.npy", f"{base}.json"
+
+
+def materialize(file_path, force=False):
+    """
+    Convert a GeoTIFF into a raw uint8 .npy file plus a JSON sidecar.
+
+    The conversion is skipped when the sidecar already records the current
+    mtime and size of the source file.
+
+    Args:
+        file_path (str): Path to the source GeoTIFF.
+        force (bool): Rewrite the store even if it is up to date.
+
+    Returns:
+        tuple: (array path, sidecar path).
+    """
+    array_path, sidecar_path = get_store_paths(file_path)
+    # A list, as stored in the JSON sidecar
+    signature = list(file_signature(file_path))
+    if not force and _read_sidecar(sidecar_path).get("signature") == signature:
+        return array_path, sidecar_path
+
+    print(f"Materializing {file_path} to {array_path}")
+    with rasterio.open(file_path) as src:
+        values = src.read(1)
+        sidecar = {
+            "signature": signature,
+            "transform": list(src.transform)[:6],
+            "crs": src.crs.to_wkt(),
+        }
+
+    # The sidecar goes last, so a store is only trusted once its array is complete
+    with atomic_write(array_path) as f:
+        np.save(f, values)
+    with atomic_write(sidecar_path, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f)
+    return array_path, sidecar_path
+
+
+def open_materialized(file_path):
+    """
+    Memory-map the materialized copy of a GeoTIFF, creating it if needed.
+
+    Args:
+        file_path (str): Path to the source GeoTIFF.
+
+    Returns:
+        tuple: (read-only np.memmap, Affine transform, CRS).
+    """
+    array_path, sidecar_path = materialize(file_path)
+    sidecar = _read_sidecar(sidecar_path)
+    array = np.load(array_path, mmap_mode="r")
+    return array, Affine(*sidecar["transform"]), CRS.from_wkt(sidecar["crs"])
+
+
+def _read_sidecar(sidecar_path):
+    try:
+        with open(sidecar_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+if __name__ == "__main__":
+    # Usage: python -m utils.raster_store [data_dir]
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    for tif_path in sorted(glob.glob(os.path.join(data_dir, "LC_Type1_*.tif"))):
+        materialize(tif_path)
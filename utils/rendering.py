@@ -0,0 +1,98 @@
+import io
+import zlib
+import base64
+import struct
+import numpy as np
+from utils import metrics
+
+# RGBA color of pixels belonging to the selected class in map overlays and tiles
+MASK_COLOR = (26, 152, 80, 255)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def encode_indexed_png(indices, palette, compression=6):
+    """
+    Encode a 2-D array of palette indices as a lossless 8-bit indexed PNG.
+
+    Pixels are written as-is behind a PLTE/tRNS palette, so no per-pixel
+    color conversion is needed. Only NumPy and zlib are used, which makes
+    the encoder safe to call from several threads at once.
+
+    Args:
+        indices (np.ndarray): 2-D uint8 array of palette indices.
+        palette (list): RGBA tuples, at most 256.
+        compression (int): zlib compression level.
+
+    Returns:
+        bytes: PNG image data.
+    """
+    height, width = indices.shape
+    # Every scanline starts with filter type 0 (None)
+    scanlines = np.zeros((height, width + 1), dtype=np.uint8)
+    scanlines[:, 1:] = indices
+
+    colors = np.array(palette, dtype=np.uint8).reshape(-1, 4)
+    header = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+    return b"".join([
+        PNG_SIGNATURE,
+        _chunk(b"IHDR", header),
+        _chunk(b"PLTE", colors[:, :3].tobytes()),
+        _chunk(b"tRNS", colors[:, 3].tobytes()),
+        _chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compression)),
+        _chunk(b"IEND", b""),
+    ])
+
+
+def render_mask_png(mask, color=MASK_COLOR):
+    """
+    Render a boolean mask as a PNG with color on a transparent background.
+
+    Args:
+        mask (np.ndarray): 2-D boolean (or 0/1) array.
+        color (tuple): RGBA color of the True pixels.
+
+    Returns:
+        bytes: PNG image data.
+    """
+    return encode_indexed_png(mask.astype(np.uint8, copy=False), [(0, 0, 0, 0), color])
+
+
+def new_figure(figsize, layout=None):
+    """
+    Create a Matplotlib figure without touching the global pyplot state.
+
+    Args:
+        figsize (tuple): Figure size in inches.
+        layout (str, optional): Layout engine, e.g. "constrained".
+
+    Returns:
+        Figure: A new figure attached to an Agg canvas.
+    """
+    # Matplotlib is loaded with the first chart rather than at import time
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize, layout=layout)
+
+
+def figure_to_base64(fig, **savefig_kwargs):
+    """
+    Render a figure to a base64-encoded PNG string.
+
+    Args:
+        fig (Figure): Figure to render.
+        **savefig_kwargs: Extra arguments for Figure.savefig.
+
+    Returns:
+        str: Base64-encoded PNG.
+    """
+    buffer = io.BytesIO()
+    with metrics.span("savefig"):
+        fig.savefig(buffer, format="png", **savefig_kwargs)
+    with metrics.span("base64"):
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def _chunk(chunk_type, data):
+    """Build one length-prefixed, CRC-terminated PNG chunk."""
+    crc = zlib.crc32(chunk_type + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
@@ -0,0 +1,115 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+import pyproj
+from rasterio.transform import Affine, array_bounds
+from rasterio.warp import calculate_default_transform
+from utils.cache_util import atomic_write, single_flight
+
+# Destination grid of a reprojection plus, for every destination pixel, the flat
+# index of the source pixel it takes its value from (-1 outside the source)
+ReprojectionGrid = namedtuple("ReprojectionGrid", ["transform", "shape", "index"])
+
+# Destination rows mapped per batch when building a grid
+CHUNK_ROWS = 256
+MAX_CACHED_GRIDS = 8
+
+_lock = threading.Lock()
+_grids = OrderedDict()  # grid key -> ReprojectionGrid
+_loading = {}  # grid key -> Event set once the grid is cached
+
+
+def get_reprojection_grid(src_transform, src_crs, src_shape, dst_crs, cache_dir):
+    """
+    Return the nearest-neighbour reprojection grid for a source grid and destination CRS.
+
+    The grid is identical for every raster sharing the source grid (all the
+    LC_Type1 years), so it is built once, persisted as .npz in cache_dir and
+    kept in memory.
+
+    Args:
+        src_transform (Affine): Transform of the source grid.
+        src_crs (CRS): CRS of the source grid.
+        src_shape (tuple): (height, width) of the source grid.
+        dst_crs (str): Destination CRS, e.g. "EPSG:4326".
+        cache_dir (str): Directory for persisted grids.
+
+    Returns:
+        ReprojectionGrid: Destination transform, shape and int32 source index map.
+    """
+    key = hashlib.sha1(
+        repr((tuple(src_transform)[:6], src_crs.to_wkt(), tuple(src_shape), dst_crs)).encode("utf-8")
+    ).hexdigest()
+
+    def lookup():
+        grid = _grids.get(key)
+        if grid is not None:
+            _grids.move_to_end(key)
+        return grid
+
+    def load():
+        grid_path = os.path.join(cache_dir, "reprojection", f"{key}.npz")
+        if os.path.exists(grid_path):
+            with np.load(grid_path) as saved:
+                grid = ReprojectionGrid(Affine(*saved["transform"]), tuple(saved["shape"]), saved["index"])
+        else:
+            grid = _build_grid(src_transform, src_crs, src_shape, dst_crs)
+            with atomic_write(grid_path) as f:
+                np.savez(f, transform=list(grid.transform)[:6], shape=grid.shape, index=grid.index)
+        grid.index.flags.writeable = False
+
+        with _lock:
+            _grids[key] = grid
+            while len(_grids) > MAX_CACHED_GRIDS:
+                _grids.popitem(last=False)
+        return grid
+
+    return single_flight(_lock, _loading, key, lookup, load)
+
+
+def apply_grid(array, grid, fill_value=0):
+    """
+    Reproject an array with a precomputed grid using a single fancy-index gather.
+
+    Args:
+        array (np.ndarray): 2-D source array on the grid's source grid.
+        grid (ReprojectionGrid): Output of get_reprojection_grid.
+        fill_value: Value for destination pixels outside the source.
+
+    Returns:
+        np.ndarray: Reprojected array with the grid's destination shape.
+    """
+    flat = array.ravel()
+    destination = flat[np.maximum(grid.index, 0)]
+    destination[grid.index < 0] = fill_value
+    return destination.reshape(grid.shape)
+
+
+def _build_grid(src_transform, src_crs, src_shape, dst_crs):
+    """Map the centre of every destination pixel back to its source pixel."""
+    src_height, src_width = src_shape
+    dst_transform, dst_width, dst_height = calculate_default_transform(
+        src_crs, dst_crs, src_width, src_height, *array_bounds(src_height, src_width, src_transform)
+    )
+    to_source = pyproj.Transformer.from_crs(
+        pyproj.CRS.from_user_input(dst_crs), pyproj.CRS.from_wkt(src_crs.to_wkt()), always_xy=True
+    )
+    inverse = ~src_transform
+
+    index = np.empty((dst_height, dst_width), dtype=np.int32)
+    cols = np.arange(dst_width) + 0.5
+    for row in range(0, dst_height, CHUNK_ROWS):
+        rows = np.arange(row, min(row + CHUNK_ROWS, dst_height)) + 0.5
+        col_grid, row_grid = np.meshgrid(cols, rows)
+        xs, ys = dst_transform * (col_grid, row_grid)
+        src_xs, src_ys = to_source.transform(xs, ys)
+        src_cols, src_rows = inverse * (src_xs, src_ys)
+        with np.errstate(invalid="ignore"):
+            src_cols = np.floor(src_cols)
+            src_rows = np.floor(src_rows)
+            valid = (src_cols >= 0) & (src_cols < src_width) & (src_rows >= 0) & (src_rows < src_height)
+        flat = np.where(valid, src_rows * src_width + src_cols, -1)
+        index[row:row + len(rows)] = flat.astype(np.int32)
+    return ReprojectionGrid(dst_transform, (dst_height, dst_width), index)
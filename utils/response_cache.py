@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from utils.cache_util import file_signature
+
+
+class ResponseCache:
+    """
+    In-memory TTL cache with an entry bound and single-flight computation.
+
+    Concurrent callers asking for the same missing key wait for one shared
+    computation instead of each running it. Failures are not cached; every
+    waiting caller receives the exception.
+
+    Entries can be pinned under a slot, such as one precomputed query per
+    raster and class. Pinned entries neither expire nor count towards the
+    entry bound; pinning a new key under the same slot releases the previous
+    one back to the normal TTL and eviction.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expiry time, value)
+        self._in_flight = {}  # key -> Future
+        self._pinned = {}  # key -> value kept without expiry
+        self._pin_slots = {}  # slot -> key pinned under it
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_compute(self, key, compute, pin=None):
+        """
+        Return the cached value for key, computing it once on a miss.
+
+        Args:
+            key (hashable): Cache key.
+            compute (callable): Zero-argument function producing the value.
+            pin (hashable, optional): Slot to pin the entry under, replacing the key pinned there before.
+
+        Returns:
+            The cached or freshly computed value.
+        """
+        with self._lock:
+            if key in self._pinned:
+                self.hits += 1
+                return self._pinned[key]
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                if pin is not None:
+                    self._pin(pin, key, entry[1])
+                else:
+                    self._entries.move_to_end(key)
+                return entry[1]
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(value)
+            with self._lock:
+                if pin is not None:
+                    self._pin(pin, key, value)
+                else:
+                    self._store(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _store(self, key, value):
+        """Insert an expiring entry and evict the least recently used ones; holds _lock."""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _pin(self, slot, key, value):
+        """Pin an entry under a slot, releasing the slot's previous key; holds _lock."""
+        self._entries.pop(key, None)
+        previous = self._pin_slots.get(slot)
+        if previous is not None and previous != key:
+            self._store(previous, self._pinned.pop(previous))
+        self._pin_slots[slot] = key
+        self._pinned[key] = value
+
+    def clear(self):
+        """Drop every cached entry, pinned ones included."""
+        with self._lock:
+            self._entries.clear()
+            self._pinned.clear()
+            self._pin_slots.clear()
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: Hits, misses, coalesced waits, entry count and pinned entry count.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "entries": len(self._entries) + len(self._pinned),
+                "pinned": len(self._pinned),
+            }
+
+
+def data_versions(years, data_dir):
+    """
+    Return the (year, mtime, size) versions of the raster files for the given years.
+
+    Args:
+        years (list): Years of the query.
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        tuple: One (year, mtime_ns, size) tuple per year; missing files get None values.
+    """
+    versions = []
+    for year in years:
+        try:
+            versions.append((str(year), *file_signature(os.path.join(data_dir, f"LC_Type1_{year}.tif"))))
+        except FileNotFoundError:
+            versions.append((str(year), None, None))
+    return tuple(versions)
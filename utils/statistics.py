@@ -0,0 +1,78 @@
+import os
+import numpy as np
+from utils.global_config import VARIABLE_CODE_MAPPING
+from utils.class_index import get_class_stats
+from utils.executor import map_ordered
+from utils.zonal import compute_zonal_stats
+from utils import metrics
+
+
+def compute_class_table(years, data_dir, region=None):
+    """
+    Build the year x class table of pixel counts and areas for several years at once.
+
+    Every row comes from the persistent class histogram index, or from the
+    cached zonal histogram when a region is given, so a multi-year query costs
+    one lookup per year instead of one mask evaluation per year and class.
+    Years missing from the index are indexed concurrently on the shared pool.
+
+    Args:
+        years (list): Years to include, in the order they should appear in the table.
+        data_dir (str): Path to the directory containing raster files.
+        region (dict, optional): Region from load_region to restrict the counts to.
+
+    Returns:
+        dict: {"years": [int], "variables": [str], "codes": [int],
+               "counts": int64 array of shape (len(years), len(codes)),
+               "areas": float64 array of km² with the same shape,
+               "transforms": [Affine], "crs": [CRS]} with one column per class
+               of VARIABLE_CODE_MAPPING.
+    """
+    file_paths = []
+    for year in years:
+        file_path = os.path.join(data_dir, f"LC_Type1_{year}.tif")
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Raster file not found for year {year}: {file_path}")
+        file_paths.append(file_path)
+
+    codes = list(VARIABLE_CODE_MAPPING.values())
+    rows = map_ordered(_year_row, file_paths, [codes] * len(years), [region] * len(years))
+    return {
+        "years": [int(year) for year in years],
+        "variables": list(VARIABLE_CODE_MAPPING),
+        "codes": codes,
+        "counts": np.array([row[0] for row in rows], dtype=np.int64).reshape(len(years), len(codes)),
+        "areas": np.array([row[1] for row in rows], dtype=np.float64).reshape(len(years), len(codes)),
+        "transforms": [row[2] for row in rows],
+        "crs": [row[3] for row in rows],
+    }
+
+
+def class_totals(table, codes):
+    """
+    Sum the columns of a class table over a set of codes, e.g. the members of a group.
+
+    Args:
+        table (dict): Output of compute_class_table.
+        codes (list): Class codes to add up.
+
+    Returns:
+        tuple: (int64 pixel counts, float64 areas in km²), one value per year of the table.
+    """
+    columns = [table["codes"].index(code) for code in codes]
+    return table["counts"][:, columns].sum(axis=1), table["areas"][:, columns].sum(axis=1)
+
+
+def _year_row(file_path, codes, region=None):
+    """Return the class counts, areas and georeferencing of one year's raster."""
+    with metrics.span("class_stats"):
+        stats = get_class_stats(file_path)
+    if region is None:
+        counts = [stats["counts"][code] for code in codes]
+        areas = [stats["areas"][code] for code in codes]
+    else:
+        with metrics.span("zonal_stats"):
+            zonal_stats = compute_zonal_stats(file_path, region)
+        counts = [int(zonal_stats["counts"][code]) for code in codes]
+        areas = [float(zonal_stats["areas"][code]) for code in codes]
+    return counts, areas, stats["transform"], stats["crs"]
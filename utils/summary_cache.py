@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import closing
+from concurrent.futures import Future
+
+# Bump when the way summaries are keyed or stored changes
+SUMMARY_CACHE_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+
+class SummaryAbandoned(Exception):
+    """Raised to callers waiting on a streamed summary whose consumer went away."""
+
+
+def summary_key(messages, model, **params):
+    """
+    Hash the prompt and model parameters of a summary into a cache key.
+
+    Message contents are stripped and their whitespace runs collapsed, so
+    prompts that only differ in layout share an entry.
+
+    Args:
+        messages (list): Chat messages sent to the model.
+        model (str): Model name.
+        **params: Generation parameters such as max_tokens and temperature.
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    normalized = [
+        {"role": message["role"], "content": " ".join(message["content"].split())}
+        for message in messages
+    ]
+    payload = json.dumps(
+        {"version": SUMMARY_CACHE_VERSION, "model": model, "params": params, "messages": normalized},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """
+    Persistent SQLite cache of generated summaries with TTL and a size bound.
+
+    Entries younger than ttl are served as hits. Older entries are kept for
+    another stale_ttl seconds and only returned when explicitly asked for,
+    e.g. as a fallback when the model times out. When the stored text exceeds
+    max_bytes the least recently used entries are evicted. The database is
+    shared by every worker process; concurrent computations of the same key
+    are coalesced within a process.
+    """
+
+    def __init__(self, path, ttl, max_bytes, stale_ttl=0):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self._in_flight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._initialized = False
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def _connect(self):
+        # A connection per operation keeps the cache safe across threads and forks
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._initialized:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(SCHEMA)
+            self._initialized = True
+        return connection
+
+    def get(self, key, stale=False):
+        """
+        Return the cached summary for key.
+
+        Args:
+            key (str): Key from summary_key.
+            stale (bool): Also return entries past their TTL that have not been purged yet.
+
+        Returns:
+            str or None: Cached text, or None on a miss.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT text, created FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None or (not stale and row[1] + self.ttl <= now):
+                return None
+            connection.execute("UPDATE summaries SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key, text):
+        """
+        Store a summary and evict expired and least recently used entries.
+
+        Args:
+            key (str): Key from summary_key.
+            text (str): Summary text.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "INSERT OR REPLACE INTO summaries (key, text, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, text, len(text.encode("utf-8")), now, now),
+            )
+            evicted = connection.execute(
+                "DELETE FROM summaries WHERE created <= ?", (now - self.ttl - self.stale_ttl,)
+            ).rowcount
+            total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+            if total > self.max_bytes:
+                excess = []
+                for old_key, size in connection.execute(
+                    "SELECT key, size FROM summaries WHERE key != ? ORDER BY accessed", (key,)
+                ):
+                    if total <= self.max_bytes:
+                        break
+                    excess.append((old_key,))
+                    total -= size
+                connection.executemany("DELETE FROM summaries WHERE key = ?", excess)
+                evicted += len(excess)
+            connection.execute("COMMIT")
+        with self._lock:
+            self.evictions += evicted
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached summary for key, computing and storing it once on a miss.
+
+        Args:
+            key (str): Key from summary_key.
+            compute (callable): Zero-argument function producing the text.
+
+        Returns:
+            str: Cached or freshly generated text.
+        """
+        text, future = self._claim(key)
+        if text is not None:
+            return text
+        if future is not None:
+            return future.result()
+
+        try:
+            text = compute()
+        except BaseException as e:
+            self._release(key, error=e)
+            raise
+        self._release(key, text=text)
+        return text
+
+    def stream(self, key, generate):
+        """
+        Yield the cached summary for key, or stream and store a fresh one.
+
+        Hits and callers waiting on another caller's computation receive the
+        whole text as a single fragment.
+
+        Args:
+            key (str): Key from summary_key.
+            generate (callable): Zero-argument function returning an iterator of text fragments.
+
+        Yields:
+            str: Fragments of the summary text.
+        """
+        while True:
+            text, future = self._claim(key)
+            if text is not None:
+                yield text
+                return
+            if future is None:
+                break
+            try:
+                text = future.result()
+            except SummaryAbandoned:
+                # The leader's client disconnected; take over the computation
+                continue
+            yield text
+            return
+
+        fragments = []
+        try:
+            for fragment in generate():
+                fragments.append(fragment)
+                yield fragment
+        except GeneratorExit:
+            self._release(key, error=SummaryAbandoned())
+            raise
+        except BaseException as e:
+            self._release(key, error=e)
+            raise
+        self._release(key, text="".join(fragments))
+
+    def _claim(self, key):
+        """Return (cached text, None), (None, Future to wait on) or (None, None) for the leader."""
+        text = self.get(key)
+        with self._lock:
+            if text is not None:
+                self.hits += 1
+                return text, None
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future
+            self.misses += 1
+            self._in_flight[key] = Future()
+            return None, None
+
+    def _release(self, key, text=None, error=None):
+        """Store the leader's result and hand it, or its error, to the waiting callers."""
+        try:
+            if error is None:
+                self.put(key, text)
+        finally:
+            with self._lock:
+                future = self._in_flight.pop(key)
+            if error is None:
+                future.set_result(text)
+            else:
+                future.set_exception(error)
+
+    def fallback(self, key):
+        """
+        Return a stored summary for key regardless of its age, for use when the model fails.
+
+        Args:
+            key (str): Key from summary_key.
+
+        Returns:
+            str or None: Cached text, or None when nothing is stored.
+        """
+        text = self.get(key, stale=True)
+        if text is not None:
+            with self._lock:
+                self.stale_hits += 1
+        return text
+
+    def clear(self):
+        """Drop every stored summary."""
+        with closing(self._connect()) as connection:
+            connection.execute("DELETE FROM summaries")
+
+    def stats(self):
+        """
+        Return cache counters.
+
+        Returns:
+            dict: Hits, misses, coalesced waits, stale fallbacks, evictions, entry count and stored bytes.
+        """
+        with closing(self._connect()) as connection:
+            entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries").fetchone()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+            }
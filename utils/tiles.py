@@ -0,0 +1,297 @@
+import os
+import math
+import time
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+from rasterio.warp import reproject, transform_bounds, Resampling
+from utils.global_config import CACHE_SUBDIR, TILE_CACHE_MAX_ENTRIES, TILE_MAX_ZOOM, TILE_DISK_CACHE_MAX_BYTES
+from utils.rendering import render_mask_png
+from utils.bitmask_index import variable_codes, class_mask
+from utils.cache_util import file_signature, atomic_write
+from utils import metrics
+
+TILE_SIZE = 256
+# Bump when rendering changes so tiles cached on disk are replaced
+TILE_CACHE_VERSION = 2
+WEB_MERCATOR_HALF_WORLD = 20037508.342789244
+
+# Value of tile pixels outside the raster; not a class code, unlike the raster's nodata (255 = no_data)
+FILL_VALUE = 0
+
+# Minimum number of seconds between two prunes of the disk tile cache in one process
+PRUNE_INTERVAL = 60
+
+_lock = threading.Lock()
+_memory_cache = OrderedDict()  # (file signature, codes, z, x, y) -> PNG bytes
+_current_signatures = set()  # tile directories whose older versions were already removed
+_raster_bounds = {}  # file signature -> Web Mercator bounds of the raster
+_last_prune = 0.0
+_empty_tile = None
+
+
+def tile_version(year, data_dir):
+    """
+    Return the version of a year's raster that tile URLs carry.
+
+    Args:
+        year (str): Year of the raster.
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        str: "<mtime_ns>-<size>" of the raster file.
+    """
+    mtime_ns, size = file_signature(os.path.join(data_dir, f"LC_Type1_{year}.tif"))
+    return f"{mtime_ns}-{size}"
+
+
+def tile_url_template(year, variable, data_dir):
+    """
+    Return the XYZ URL template of the class tiles for a year and variable.
+
+    The URL carries the raster version, so browsers fetch new tiles once the
+    raster is replaced instead of reusing cached ones.
+
+    Args:
+        year (str): Year of the raster.
+        variable (str): Variable label.
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        str: URL template with {z}/{x}/{y} placeholders.
+    """
+    return f"/tiles/{year}/{variable}/{{z}}/{{x}}/{{y}}.png?v={tile_version(year, data_dir)}"
+
+
+def tile_bounds(z, x, y):
+    """
+    Return the Web Mercator bounds of an XYZ tile.
+
+    Args:
+        z (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row, counted from the top.
+
+    Returns:
+        tuple: (left, bottom, right, top) in EPSG:3857 metres.
+    """
+    size = 2 * WEB_MERCATOR_HALF_WORLD / (2 ** z)
+    left = -WEB_MERCATOR_HALF_WORLD + x * size
+    top = WEB_MERCATOR_HALF_WORLD - y * size
+    return left, top - size, left + size, top
+
+
+def get_tile(year, variable, z, x, y, data_dir):
+    """
+    Return the PNG tile showing one class of a year's raster, rendering it on a cache miss.
+
+    Tiles are cached in memory and on disk under the data directory, keyed on
+    the raster's mtime and size so replaced files produce fresh tiles. Tiles
+    outside the raster are the shared empty tile and are not cached. The disk
+    cache is bounded by TILE_DISK_CACHE_MAX_BYTES.
+
+    Args:
+        year (str): Year of the raster.
+        variable (str): Variable label.
+        z (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row.
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        bytes: PNG image data.
+
+    Raises:
+        FileNotFoundError: If the year has no raster.
+        ValueError: If the variable is unknown or the tile does not exist up to TILE_MAX_ZOOM.
+    """
+    codes = variable_codes(variable)
+    codes_key = "-".join(str(code) for code in codes)
+    file_path = os.path.join(data_dir, f"LC_Type1_{year}.tif")
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Raster file not found for year {year}: {file_path}")
+    if not (0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"Invalid tile: {z}/{x}/{y}")
+
+    mtime_ns, size = file_signature(file_path)
+    signature = f"{year}-{mtime_ns}-{size}-v{TILE_CACHE_VERSION}"
+    if not _intersects_raster(file_path, signature, z, x, y):
+        return _get_empty_tile()
+    key = (signature, codes_key, z, x, y)
+    with _lock:
+        png = _memory_cache.get(key)
+        if png is not None:
+            _memory_cache.move_to_end(key)
+    if png is not None:
+        metrics.increment("cache_hits_total", cache="tile_memory")
+        return png
+    metrics.increment("cache_misses_total", cache="tile_memory")
+
+    disk_path = os.path.join(
+        data_dir, CACHE_SUBDIR, "tiles", signature, codes_key, str(z), str(x), f"{y}.png"
+    )
+    try:
+        with open(disk_path, "rb") as f:
+            png = f.read()
+        # The mtime orders tiles for pruning, least recently used first
+        os.utime(disk_path)
+        metrics.increment("cache_hits_total", cache="tile_disk")
+    except OSError:
+        metrics.increment("cache_misses_total", cache="tile_disk")
+        with metrics.span("render_tile"):
+            png = render_tile(file_path, codes, z, x, y)
+        _purge_stale_tiles(data_dir, year, signature)
+        with atomic_write(disk_path) as f:
+            f.write(png)
+        _maybe_prune(data_dir)
+
+    with _lock:
+        _memory_cache[key] = png
+        while len(_memory_cache) > TILE_CACHE_MAX_ENTRIES:
+            _memory_cache.popitem(last=False)
+    return png
+
+
+def render_tile(file_path, codes, z, x, y):
+    """
+    Render one XYZ tile of a class mask from the closest COG overview.
+
+    Only the part of the chosen overview covering the tile is read and
+    warped to Web Mercator.
+
+    Args:
+        file_path (str): Path to the raster file.
+        codes (list): Class codes to highlight.
+        z (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row.
+
+    Returns:
+        bytes: PNG image data.
+    """
+    left, bottom, right, top = tile_bounds(z, x, y)
+    tile_resolution = (right - left) / TILE_SIZE
+
+    with rasterio.open(file_path) as src:
+        raster_left, raster_bottom, raster_right, raster_top = transform_bounds(src.crs, "EPSG:3857", *src.bounds)
+        if left >= raster_right or right <= raster_left or bottom >= raster_top or top <= raster_bottom:
+            return _get_empty_tile()
+
+        # Web Mercator inflates distances by 1/cos(latitude); compare in ground units
+        latitude = math.atan(math.sinh((top + bottom) / 2 / 6378137.0))
+        ground_resolution = tile_resolution * math.cos(latitude)
+        overview_level = _pick_overview_level(src.overviews(1), ground_resolution / abs(src.transform.a))
+
+    open_options = {} if overview_level is None else {"OVERVIEW_LEVEL": overview_level}
+    destination = np.full((TILE_SIZE, TILE_SIZE), FILL_VALUE, dtype=np.uint8)
+    with rasterio.open(file_path, **open_options) as src:
+        # The raster's own nodata (255) is the no_data class and is copied like any other code;
+        # only the area outside the raster keeps FILL_VALUE
+        reproject(
+            source=rasterio.band(src, 1),
+            destination=destination,
+            src_nodata=FILL_VALUE,
+            dst_transform=from_bounds(left, bottom, right, top, TILE_SIZE, TILE_SIZE),
+            dst_crs="EPSG:3857",
+            dst_nodata=FILL_VALUE,
+            resampling=Resampling.nearest,
+        )
+
+    return render_mask_png(class_mask(destination, codes))
+
+
+def prune_tiles(data_dir, max_bytes=TILE_DISK_CACHE_MAX_BYTES):
+    """
+    Delete the least recently used disk tiles until the tile cache fits in max_bytes.
+
+    Args:
+        data_dir (str): Path to the data directory holding the cache.
+        max_bytes (int): Size budget of the tile directory.
+
+    Returns:
+        int: Number of tiles deleted.
+    """
+    tiles = []  # (mtime, bytes, path)
+    total = 0
+    for root, _, names in os.walk(os.path.join(data_dir, CACHE_SUBDIR, "tiles")):
+        for name in names:
+            if not name.endswith(".png"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            tiles.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    deleted = 0
+    for _, size, path in sorted(tiles):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        deleted += 1
+    return deleted
+
+
+def _maybe_prune(data_dir):
+    """Run prune_tiles at most once per PRUNE_INTERVAL in this process."""
+    global _last_prune
+    with _lock:
+        if time.monotonic() - _last_prune < PRUNE_INTERVAL:
+            return
+        _last_prune = time.monotonic()
+    prune_tiles(data_dir)
+
+
+def _intersects_raster(file_path, signature, z, x, y):
+    """Tell whether a tile overlaps the raster, from its Web Mercator bounds cached per file version."""
+    with _lock:
+        bounds = _raster_bounds.get(signature)
+    if bounds is None:
+        with rasterio.open(file_path) as src:
+            bounds = transform_bounds(src.crs, "EPSG:3857", *src.bounds)
+        with _lock:
+            _raster_bounds[signature] = bounds
+    raster_left, raster_bottom, raster_right, raster_top = bounds
+    left, bottom, right, top = tile_bounds(z, x, y)
+    return left < raster_right and right > raster_left and bottom < raster_top and top > raster_bottom
+
+
+def _pick_overview_level(factors, decimation):
+    """Return the coarsest overview whose pixels are still no larger than a tile pixel."""
+    level = None
+    for index, factor in enumerate(factors):
+        if factor <= decimation:
+            level = index
+    return level
+
+
+def _purge_stale_tiles(data_dir, year, signature):
+    """Remove the disk tiles of older versions of a year's raster, once per new version."""
+    with _lock:
+        if signature in _current_signatures:
+            return
+        _current_signatures.add(signature)
+    tiles_dir = os.path.join(data_dir, CACHE_SUBDIR, "tiles")
+    try:
+        names = os.listdir(tiles_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith(f"{year}-") and name != signature:
+            shutil.rmtree(os.path.join(tiles_dir, name), ignore_errors=True)
+
+
+def _get_empty_tile():
+    global _empty_tile
+    if _empty_tile is None:
+        _empty_tile = render_mask_png(np.zeros((TILE_SIZE, TILE_SIZE), dtype=bool))
+    return _empty_tile
@@ -0,0 +1,364 @@
+import os
+import sys
+import threading
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from rasterio.windows import Window
+from utils.global_config import YEARS, CACHE_SUBDIR
+from utils.pixel_area import get_row_areas
+from utils.cache_util import file_signature, atomic_write, single_flight
+from utils import metrics
+
+CUBE_FILENAME = "trajectory_cube.npz"
+CUBE_VERSION = 1
+
+# Rows of every year read together while building the cube
+CHUNK_ROWS = 512
+
+_lock = threading.Lock()
+_cubes = {}  # cube path -> TrajectoryCube
+_loading = {}  # cube path -> Event set once the cube is loaded or built
+
+
+class TrajectoryCube:
+    """
+    Run-length encoded class sequence of every pixel over the available years.
+
+    Every pixel stores its class in the first year. Pixels whose class ever
+    changes additionally store one run per change: the year index the run
+    starts at and its class. Runs are grouped per changed pixel in CSR form,
+    so the common never-changing pixel costs one byte.
+
+    Attributes:
+        years (list): Years covered, in order.
+        first (np.ndarray): uint8 class of every pixel in the first year, flattened.
+        changed_idx (np.ndarray): Sorted flat indices of pixels that change at least once.
+        run_offsets (np.ndarray): Start of each changed pixel's runs in run_starts/run_values.
+        run_starts (np.ndarray): uint8 year index at which each run starts (always > 0).
+        run_values (np.ndarray): uint8 class of each run.
+        transform (Affine): Transform of the grid.
+        crs (CRS): CRS of the grid.
+        shape (tuple): (height, width) of the grid.
+    """
+
+    def __init__(self, years, first, changed_idx, run_offsets, run_starts, run_values, transform, crs, shape):
+        self.years = years
+        self.first = first
+        self.changed_idx = changed_idx
+        self.run_offsets = run_offsets
+        self.run_starts = run_starts
+        self.run_values = run_values
+        self.transform = transform
+        self.crs = crs
+        self.shape = shape
+        self.signatures = None
+        self._run_owner = None
+
+    @property
+    def run_owner(self):
+        """Position in changed_idx of the pixel each run belongs to."""
+        if self._run_owner is None:
+            self._run_owner = np.repeat(
+                np.arange(len(self.changed_idx), dtype=np.int64), np.diff(self.run_offsets)
+            )
+        return self._run_owner
+
+    def year_index(self, year):
+        """
+        Return the position of a year in the cube.
+
+        Raises:
+            ValueError: If the year is not covered.
+        """
+        if int(year) not in self.years:
+            raise ValueError(f"Year {year} is not in the trajectory cube ({self.years[0]}-{self.years[-1]}).")
+        return self.years.index(int(year))
+
+    def changed_count(self, year_from=None, year_to=None):
+        """
+        Count the pixels whose class changed at least once between two years.
+
+        Args:
+            year_from (int, optional): Start year, the first year by default.
+            year_to (int, optional): End year, the last year by default.
+
+        Returns:
+            int: Number of pixels.
+        """
+        runs = self._runs_between(year_from, year_to)
+        return int(np.count_nonzero(np.bincount(self.run_owner[runs], minlength=len(self.changed_idx))))
+
+    def first_conversion(self, code, year_from=None, year_to=None):
+        """
+        Find the year each pixel first converted to a class after year_from.
+
+        A conversion is the start of a run of the class, so pixels that already
+        had the class in year_from only count if they left and came back.
+
+        Args:
+            code (int): Class code converted to.
+            year_from (int, optional): Start year, the first year by default.
+            year_to (int, optional): End year, the last year by default.
+
+        Returns:
+            dict: {"years": [int], "counts": int64 array, "areas": float64 km² array}
+                  with the pixels and area first converted in each year.
+        """
+        runs = self._runs_between(year_from, year_to) & (self.run_values == code)
+        owners, starts = self.run_owner[runs], self.run_starts[runs]
+        # Runs are ordered by pixel, then by start, so the first run of each pixel is the earliest
+        _, first_runs = np.unique(owners, return_index=True)
+        starts = starts[first_runs]
+        rows = self.changed_idx[owners[first_runs]] // self.shape[1]
+        row_areas = get_row_areas(self.transform, self.crs, *self.shape)
+
+        start_index = self.year_index(year_from) + 1 if year_from is not None else 1
+        stop_index = self.year_index(year_to) + 1 if year_to is not None else len(self.years)
+        counts = np.bincount(starts, minlength=len(self.years))
+        areas = np.bincount(starts, weights=row_areas[rows], minlength=len(self.years))
+        return {
+            "years": self.years[start_index:stop_index],
+            "counts": counts[start_index:stop_index],
+            "areas": areas[start_index:stop_index],
+        }
+
+    def persistence(self, year_from=None, year_to=None):
+        """
+        Count, per class, the pixels that kept the same class between two years.
+
+        Args:
+            year_from (int, optional): Start year, the first year by default.
+            year_to (int, optional): End year, the last year by default.
+
+        Returns:
+            np.ndarray: int64 histogram of length 256 indexed by class code.
+        """
+        start = self.class_at(year_from) if year_from is not None else self.first
+        runs = self._runs_between(year_from, year_to)
+        changed = self.changed_idx[np.unique(self.run_owner[runs])]
+        return np.bincount(start, minlength=256) - np.bincount(start[changed], minlength=256)
+
+    def class_at(self, year):
+        """
+        Reconstruct the flattened class plane of one year.
+
+        Args:
+            year (int): Year to decode.
+
+        Returns:
+            np.ndarray: uint8 array of length height * width.
+        """
+        index = self.year_index(year)
+        plane = self.first.copy()
+        runs = self.run_starts <= index
+        # Later runs of a pixel overwrite earlier ones, leaving the run active in that year
+        plane[self.changed_idx[self.run_owner[runs]]] = self.run_values[runs]
+        return plane
+
+    def _runs_between(self, year_from, year_to):
+        """Boolean selection of the runs starting after year_from and no later than year_to."""
+        selected = np.ones(len(self.run_starts), dtype=bool)
+        if year_from is not None:
+            selected &= self.run_starts > self.year_index(year_from)
+        if year_to is not None:
+            selected &= self.run_starts <= self.year_index(year_to)
+        return selected
+
+
+def get_cube_path(data_dir):
+    """
+    Return the location of the trajectory cube for a data directory.
+
+    Args:
+        data_dir (str): Path to the data directory.
+
+    Returns:
+        str: Path to the .npz file.
+    """
+    return os.path.join(data_dir, CACHE_SUBDIR, CUBE_FILENAME)
+
+
+def get_trajectory_cube(data_dir):
+    """
+    Return the trajectory cube of the data directory, building it if needed.
+
+    The cube covers every year of YEARS that has a raster. It is rebuilt when
+    a raster is added, removed or replaced, and kept in memory once loaded.
+
+    Args:
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        TrajectoryCube: The cube.
+    """
+    file_paths = _year_paths(data_dir)
+    signatures = np.array([file_signature(path) for path in file_paths.values()], dtype=np.int64)
+    cube_path = get_cube_path(data_dir)
+
+    def lookup():
+        cube = _cubes.get(cube_path)
+        if cube is not None and np.array_equal(cube.signatures, signatures):
+            return cube
+        return None
+
+    def load():
+        cube = _load_cube(cube_path, signatures)
+        if cube is None:
+            with metrics.span("trajectory_build"):
+                cube = build_cube(file_paths)
+            _save_cube(cube_path, cube, signatures)
+        cube.signatures = signatures
+
+        with _lock:
+            _cubes[cube_path] = cube
+        return cube
+
+    return single_flight(_lock, _loading, cube_path, lookup, load)
+
+
+def summarize_trajectories(variable_code, year_from, year_to, data_dir):
+    """
+    Summarize how the pixels of one class evolved between two years from the cube.
+
+    Args:
+        variable_code (int): Class code of the variable.
+        year_from (int): Start year.
+        year_to (int): End year.
+        data_dir (str): Path to the directory containing raster files.
+
+    Returns:
+        dict: {"years": [from, to], "changed_pixels": pixels of any class that changed
+               at least once, "persistent_pixels": pixels of the class that never changed,
+               "first_conversions": {year: (pixels, area km²)} first converted to the class}.
+    """
+    cube = get_trajectory_cube(data_dir)
+    conversions = cube.first_conversion(variable_code, year_from, year_to)
+    return {
+        "years": [int(year_from), int(year_to)],
+        "changed_pixels": cube.changed_count(year_from, year_to),
+        "persistent_pixels": int(cube.persistence(year_from, year_to)[variable_code]),
+        "first_conversions": {
+            year: (int(count), float(area))
+            for year, count, area in zip(conversions["years"], conversions["counts"], conversions["areas"])
+        },
+    }
+
+
+def build_cube(file_paths):
+    """
+    Build a trajectory cube from one raster per year in a single pass.
+
+    All years are read together strip by strip, so memory stays bounded by
+    CHUNK_ROWS rows of every year plus the encoded runs.
+
+    Args:
+        file_paths (dict): Year -> path of its raster, all on the same grid.
+
+    Returns:
+        TrajectoryCube: The encoded cube.
+
+    Raises:
+        ValueError: If fewer than two years are given or the grids differ.
+    """
+    years = sorted(int(year) for year in file_paths)
+    if len(years) < 2:
+        raise ValueError("A trajectory cube needs rasters for at least two years.")
+    sources = [rasterio.open(file_paths[year]) for year in years]
+    try:
+        grid = sources[0]
+        for src in sources[1:]:
+            if src.shape != grid.shape or src.transform != grid.transform:
+                raise ValueError("Trajectory cube requires every year on the same grid.")
+        height, width = grid.shape
+        print(f"Building trajectory cube for {years[0]}-{years[-1]}")
+
+        first = np.empty(height * width, dtype=np.uint8)
+        changed_parts, count_parts, start_parts, value_parts = [], [], [], []
+        for row in range(0, height, CHUNK_ROWS):
+            rows = min(CHUNK_ROWS, height - row)
+            window = Window(0, row, width, rows)
+            # Pixel-major (pixels, years) view of the strip
+            stack = np.stack([src.read(1, window=window) for src in sources]).reshape(len(years), -1).T
+            metrics.increment("raster_bytes_read_total", stack.nbytes, read="trajectory")
+            first[row * width:(row + rows) * width] = stack[:, 0]
+
+            steps = stack[:, 1:] != stack[:, :-1]
+            changed = np.flatnonzero(steps.any(axis=1))
+            pixel, step = np.nonzero(steps[changed])
+            changed_parts.append(changed + row * width)
+            count_parts.append(np.bincount(pixel, minlength=len(changed)))
+            start_parts.append((step + 1).astype(np.uint8))
+            value_parts.append(stack[changed[pixel], step + 1])
+    finally:
+        for src in sources:
+            src.close()
+
+    run_offsets = np.zeros(sum(len(part) for part in changed_parts) + 1, dtype=np.int64)
+    np.cumsum(np.concatenate(count_parts), out=run_offsets[1:])
+    return TrajectoryCube(
+        years=years,
+        first=first,
+        changed_idx=np.concatenate(changed_parts).astype(np.int64),
+        run_offsets=run_offsets,
+        run_starts=np.concatenate(start_parts),
+        run_values=np.concatenate(value_parts),
+        transform=grid.transform,
+        crs=grid.crs,
+        shape=(height, width),
+    )
+
+
+def _year_paths(data_dir):
+    file_paths = {}
+    for year in YEARS:
+        file_path = os.path.join(data_dir, f"LC_Type1_{year}.tif")
+        if os.path.exists(file_path):
+            file_paths[year] = file_path
+    return file_paths
+
+
+def _load_cube(cube_path, signatures):
+    try:
+        with np.load(cube_path) as cached:
+            if int(cached["version"]) != CUBE_VERSION or not np.array_equal(cached["signatures"], signatures):
+                return None
+            return TrajectoryCube(
+                years=cached["years"].tolist(),
+                first=cached["first"],
+                changed_idx=cached["changed_idx"],
+                run_offsets=cached["run_offsets"],
+                run_starts=cached["run_starts"],
+                run_values=cached["run_values"],
+                transform=Affine(*cached["transform"]),
+                crs=CRS.from_wkt(str(cached["crs"])),
+                shape=tuple(cached["shape"].tolist()),
+            )
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_cube(cube_path, cube, signatures):
+    with atomic_write(cube_path) as f:
+        np.savez_compressed(
+            f,
+            version=CUBE_VERSION,
+            signatures=signatures,
+            years=np.array(cube.years),
+            first=cube.first,
+            changed_idx=cube.changed_idx,
+            run_offsets=cube.run_offsets,
+            run_starts=cube.run_starts,
+            run_values=cube.run_values,
+            transform=np.array(tuple(cube.transform)[:6]),
+            crs=cube.crs.to_wkt(),
+            shape=np.array(cube.shape),
+        )
+
+
+if __name__ == "__main__":
+    # Usage: python -m utils.trajectory [data_dir]
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    cube = get_trajectory_cube(data_dir)
+    print(f"{len(cube.changed_idx)} of {cube.first.size} pixels change, {len(cube.run_values)} runs")
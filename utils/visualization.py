@@ -1,25 +1,20 @@
-import matplotlib.pyplot as plt
-import matplotlib
-import numpy as np
-import folium
 import rasterio
-import io
 import os
-import copy
 import base64
-import json
-import rasterio
-import rioxarray
-import geopandas as gpd
-from rasterio.plot import show
-from rasterio.mask import mask
-from utils.global_config import VARIABLE_CODE_MAPPING
-from rasterio.warp import calculate_default_transform, reproject, Resampling
-from rasterio.transform import Affine
-from shapely.geometry import mapping
-from io import BytesIO
-
-matplotlib.use('Agg')
+from utils.global_config import MAP_TILES_ENABLED, TILE_MAX_ZOOM, CHART_RASTER_SIZE, MAP_OVERLAY_SIZE, CACHE_SUBDIR
+from utils.tiles import tile_url_template
+from utils.rendering import new_figure, figure_to_base64, render_mask_png
+from utils.bitmask_index import variable_codes, class_mask
+from utils import metrics
+from utils.overviews import read_for_display
+from utils.reprojection import get_reprojection_grid, apply_grid
+from utils.change_detection import compute_change_raster, CHANGE_NONE, CHANGE_OTHER
+from utils.zonal import load_region
+from rasterio.warp import transform_bounds
+from rasterio.transform import array_bounds
+
+# Folium and Matplotlib are imported inside the functions that draw with them,
+# so each backend is only loaded once a visualization needs it
 
 def draw_choropleth_map(variable, year, data_dir):
     """
@@ -33,51 +28,94 @@ def draw_choropleth_map(variable, year, data_dir):
     Returns:
         str: Base64-encoded string of the generated choropleth map.
     """
-    # Map the variable to its numeric code
-    variable_code = VARIABLE_CODE_MAPPING[variable]
+    # Map the variable to its numeric codes
+    codes = variable_codes(variable)
     # File path for the raster file
     file_path = os.path.join(data_dir, f"LC_Type1_{year[0]}.tif")
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Raster file not found for year {year[0]}: {file_path}")
 
-    # Read the raster file
-    with rioxarray.open_rasterio(file_path) as raster:
-        raster_data = raster.squeeze()
-        bounds = raster.rio.bounds()
+    # Apply the mask for the selected variable on the coarsest level adequate for the figure
+    raster = read_for_display(file_path, CHART_RASTER_SIZE)
+    variable_mask = class_mask(raster.array, codes)
+    transform = raster.transform
+    height, width = variable_mask.shape
+    bounds = array_bounds(height, width, transform)
+
+    # Generate the plot on a standalone figure; pyplot's global state is not thread-safe
+    fig = new_figure((8, 6), layout="constrained")
+    ax = fig.add_subplot()
+    image = ax.imshow(variable_mask, extent=[bounds[0], bounds[2], bounds[1], bounds[3]], cmap="YlGn")
+    fig.colorbar(image, ax=ax, label="Land Cover Presence")
+    ax.set_title(f"Spatial Distribution of {variable} in {year}")
+    ax.set_xlabel("Longitude")
+    ax.set_ylabel("Latitude")
+    ax.grid(False)
 
-        # Apply the mask for the selected variable
-        variable_mask = raster_data == variable_code
+    # Save the plot to a base64 string
+    return figure_to_base64(fig)
 
-        # Generate the plot
-        plt.figure(figsize=(8, 6))
-        plt.imshow(variable_mask, extent=[bounds[0], bounds[2], bounds[1], bounds[3]], cmap="YlGn")
-        plt.colorbar(label="Land Cover Presence")
-        plt.title(f"Spatial Distribution of {variable} in {year}")
-        plt.xlabel("Longitude")
-        plt.ylabel("Latitude")
-        plt.grid(False)
 
-        # Save the plot to a base64 string
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format="png", bbox_inches="tight")
-        img_buffer.seek(0)
-        img_base64 = base64.b64encode(img_buffer.read()).decode("utf-8")
-        plt.close()
+def draw_change_map(variable, years, data_dir, region=None):
+    """
+    Generate a map of where the selected variable was gained or lost between two years.
 
-        return img_base64
+    Args:
+        variable (str): The land cover type selected by the user.
+        years (list): Selected years; the first and last are compared.
+        data_dir (str): Path to the directory containing raster files.
+        region (dict, optional): Region from load_region to restrict the map to.
 
+    Returns:
+        str: Base64-encoded string of the generated change map.
+    """
+    from matplotlib.colors import ListedColormap
+    from matplotlib.patches import Patch
 
+    with metrics.span("change_raster"):
+        change, transform, _ = compute_change_raster(
+            variable, years[0], years[-1], data_dir, CHART_RASTER_SIZE, region
+        )
+    bounds = array_bounds(change.shape[0], change.shape[1], transform)
+
+    # No change is transparent, gains green, losses red, other class changes grey
+    cmap = ListedColormap([(0, 0, 0, 0), "#1a9850", "#d73027", "#bdbdbd"])
+    fig = new_figure((8, 6), layout="constrained")
+    ax = fig.add_subplot()
+    ax.imshow(change, extent=[bounds[0], bounds[2], bounds[1], bounds[3]], cmap=cmap,
+              vmin=CHANGE_NONE, vmax=CHANGE_OTHER, interpolation="nearest")
+    ax.legend(
+        handles=[Patch(color="#1a9850", label="Gained"), Patch(color="#d73027", label="Lost"),
+                 Patch(color="#bdbdbd", label="Other change")],
+        loc="lower right",
+    )
+    place = f" in {region['name']}" if region else ""
+    ax.set_title(f"Change in {variable}{place} from {years[0]} to {years[-1]}")
+    ax.set_xlabel("Longitude")
+    ax.set_ylabel("Latitude")
+
+    # Save the plot to a base64 string
+    return figure_to_base64(fig)
+
+
+@metrics.timed("generate_visualizations")
 def generate_visualizations(query, data_dir, data, visualizations):
     visualization_results = {}  # Initialize an empty dictionary to store visualizations
     for viz in visualizations:
-        if viz == "line_chart":
-            visualization_results["line_chart"] = draw_line_chart(data)
-        elif viz == "bar_chart":
-            visualization_results["bar_chart"] = draw_bar_chart(data)
-        elif viz == "choropleth_map":
-            visualization_results["choropleth_map"] = draw_choropleth_map(query["variables"], query["years"], data_dir)
-        elif viz == "map":
-            visualization_results["map"] = draw_map(query["variables"], query["years"], data_dir)
+        with metrics.span(f"visualization.{viz}"):
+            if viz == "line_chart":
+                visualization_results["line_chart"] = draw_line_chart(data)
+            elif viz == "bar_chart":
+                visualization_results["bar_chart"] = draw_bar_chart(data)
+            elif viz == "choropleth_map":
+                visualization_results["choropleth_map"] = draw_choropleth_map(query["variables"], query["years"], data_dir)
+            elif viz == "map":
+                visualization_results["map"] = draw_map(query["variables"], query["years"], data_dir)
+            elif viz == "change_map" and len(query["years"]) >= 2:
+                region = load_region(query["region"], data_dir) if query.get("region") else None
+                visualization_results["change_map"] = draw_change_map(
+                    query["variables"], query["years"], data_dir, region
+                )
 
     return visualization_results
 
@@ -93,87 +131,95 @@ def draw_map(variable, year, data_dir):
     Returns:
         str: Base64-encoded HTML representation of the map.
     """
-    variable_code = VARIABLE_CODE_MAPPING[variable]
-    tif_path = os.path.join(data_dir, f"LC_Type1_{year[0]}.tif")
+    import folium
 
-    # Open the raster file
-    with rasterio.open(tif_path) as src:
-        if src.crs.to_string() != "EPSG:4326":
-            print("src.crs.to_string()")
-            print(src.crs.to_string())
-            transform, width, height = calculate_default_transform(
-                src.crs, "EPSG:4326", src.width, src.height, *src.bounds
-            )
-            kwargs = src.meta.copy()
-            kwargs.update({"crs": "EPSG:4326", "transform": transform, "width": width, "height": height})
-
-            # Reproject on-the-fly without saving
-            destination = np.zeros((height, width), dtype=np.uint8)
-            reproject(
-                source=rasterio.band(src, 1),
-                destination=destination,
-                src_transform=src.transform,
-                src_crs=src.crs,
-                dst_transform=transform,
-                dst_crs="EPSG:4326",
-                resampling=Resampling.nearest,
-            )
-        else:
-            destination = src.read(1)
-            transform = src.transform
-
-        # Mask for the variable
-        mask = (destination == variable_code).astype(float)
-
-        # Downscale the mask for reduced memory usage
-        scale_factor = 1
-        mask_resized = mask[::scale_factor, ::scale_factor]
+    codes = variable_codes(variable)
+    tif_path = os.path.join(data_dir, f"LC_Type1_{year[0]}.tif")
 
-        # Get the bounding box
-        left, bottom, right, top = rasterio.transform.array_bounds(
-            mask_resized.shape[0], mask_resized.shape[1], transform
+    if MAP_TILES_ENABLED:
+        # The browser fetches only the visible tiles from the /tiles endpoint
+        with rasterio.open(tif_path) as src:
+            left, bottom, right, top = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+        layer = folium.raster_layers.TileLayer(
+            tiles=tile_url_template(year[0], variable, data_dir),
+            attr="MODIS MCD12Q1",
+            name=variable,
+            overlay=True,
+            opacity=0.5,
+            # Deeper zooms upscale the deepest served tiles instead of requesting missing ones
+            max_native_zoom=TILE_MAX_ZOOM,
+        )
+    else:
+        image_url, (left, bottom, right, top) = _render_overlay(codes, tif_path)
+        layer = folium.raster_layers.ImageOverlay(
+            image=image_url,
+            bounds=[[bottom, left], [top, right]],
+            opacity=0.5,
         )
-        print (transform)
-
-    # Generate the overlay image in memory
-    img_buffer = BytesIO()
-    my_cmap = copy.copy(plt.cm.get_cmap('cubehelix'))  # get a copy of the gray color map
-    my_cmap.set_bad(alpha=0)  # set how the colormap handles 'bad' values
-    print(mask_resized.min())
-    print(mask_resized.max())
-    mask_resized[mask_resized<=0.] = np.nan
-    plt.imshow(mask_resized, cmap=my_cmap, interpolation="nearest")
-    plt.axis("off")
-    plt.savefig(img_buffer, format="png", bbox_inches="tight", pad_inches=0, transparent=True)
-    plt.close()
-    img_buffer.seek(0)
-    image_base64 = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
-    img_buffer.close()
-    
-    # Convert base64 image to a Folium-compatible data URL
-    image_url = f"data:image/png;base64,{image_base64}"
 
     # Create the Folium map
     center_lat = (top + bottom) / 2
     center_lon = (left + right) / 2
     m = folium.Map(location=[center_lat, center_lon], zoom_start=4, tiles="Cartodb Positron")
     print(bottom, left, top, right)
-    # Overlay the in-memory image
-    folium.raster_layers.ImageOverlay(
-        image=image_url,
-        bounds=[[bottom, left], [top, right]],
-        opacity=0.5,
-    ).add_to(m)
+    # Add the class layer
+    layer.add_to(m)
 
     # Add layer control
     folium.LayerControl().add_to(m)
 
     # Convert map to base64 string
-    map_html = m._repr_html_()
-    map_base64 = base64.b64encode(map_html.encode("utf-8")).decode("utf-8")
+    with metrics.span("folium_html"):
+        map_html = m._repr_html_()
+    with metrics.span("base64"):
+        map_base64 = base64.b64encode(map_html.encode("utf-8")).decode("utf-8")
 
     return map_base64
 
+def _render_overlay(codes, tif_path):
+    """
+    Render the class mask of a raster as a single PNG overlay in EPSG:4326.
+
+    Args:
+        codes (list): Class codes to highlight.
+        tif_path (str): Path to the GeoTIFF.
+
+    Returns:
+        tuple: (PNG data URL, (left, bottom, right, top) bounds in degrees).
+    """
+    # Reproject only the coarsest level adequate for the overlay
+    src = read_for_display(tif_path, MAP_OVERLAY_SIZE)
+    src_height, src_width = src.array.shape
+    if src.crs.to_string() != "EPSG:4326":
+        print("src.crs.to_string()")
+        print(src.crs.to_string())
+        # The destination grid and source index map are shared by every year on this grid
+        with metrics.span("reproject"):
+            grid = get_reprojection_grid(
+                src.transform, src.crs, (src_height, src_width), "EPSG:4326",
+                os.path.join(os.path.dirname(tif_path), CACHE_SUBDIR),
+            )
+            destination = apply_grid(src.array, grid)
+        transform = grid.transform
+    else:
+        destination = src.array
+        transform = src.transform
+
+    # Mask for the variable
+    mask = class_mask(destination, codes)
+
+    # Get the bounding box
+    left, bottom, right, top = rasterio.transform.array_bounds(mask.shape[0], mask.shape[1], transform)
+
+    # Encode the mask directly as a palette PNG with transparent background
+    with metrics.span("encode_png"):
+        image_base64 = base64.b64encode(render_mask_png(mask)).decode("utf-8")
+
+    # Convert base64 image to a Folium-compatible data URL
+    image_url = f"data:image/png;base64,{image_base64}"
+
+    return image_url, (left, bottom, right, top)
+
 def draw_bar_chart(data):
     """
     Create a bar chart for comparison between two years.
@@ -185,26 +231,50 @@ def draw_bar_chart(data):
         str: Base64-encoded string of the generated bar chart.
     """
     years = list(data.keys())
-    areas = [entry["area_km2"] for entry in data]
+    areas = [entry["area_km2"] for entry in data.values()]
 
-    plt.figure(figsize=(10, 7))
-    plt.bar(years, areas, color="orange", label="Area (km²)")
-    plt.title("Comparison Analysis: Area for Selected Years", fontsize=16)
-    plt.xlabel("Years", fontsize=14)
-    plt.ylabel("Area (km²)", fontsize=14)
-    plt.xticks(fontsize=12)
-    plt.yticks(fontsize=12)
-    plt.grid(axis="y")
-    plt.legend(fontsize=12)
+    fig = new_figure((10, 7))
+    ax = fig.add_subplot()
+    ax.bar(years, areas, color="orange", label="Area (km²)")
+    ax.set_title("Comparison Analysis: Area for Selected Years", fontsize=16)
+    ax.set_xlabel("Years", fontsize=14)
+    ax.set_ylabel("Area (km²)", fontsize=14)
+    ax.tick_params(labelsize=12)
+    ax.grid(axis="y")
+    ax.legend(fontsize=12)
 
-    plt.figtext(0.5, -0.1, "This bar chart compares the area coverage for the selected years.", 
-                wrap=True, horizontalalignment='center', fontsize=12)
+    fig.text(0.5, -0.1, "This bar chart compares the area coverage for the selected years.",
+             wrap=True, horizontalalignment='center', fontsize=12)
 
     # Save the chart to a base64 string
-    img_io = io.BytesIO()
-    plt.savefig(img_io, format="png", bbox_inches="tight")
-    img_io.seek(0)
-    img_base64 = base64.b64encode(img_io.read()).decode("utf-8")
-    plt.close()
+    return figure_to_base64(fig, bbox_inches="tight")
+
 
-    return img_base64
\ No newline at end of file
+def draw_line_chart(data):
+    """
+    Create a line chart of the area over the selected years.
+
+    Args:
+        data (dict): Processed data containing area information for each year.
+
+    Returns:
+        str: Base64-encoded string of the generated line chart.
+    """
+    years = list(data.keys())
+    areas = [entry["area_km2"] for entry in data.values()]
+
+    fig = new_figure((10, 7))
+    ax = fig.add_subplot()
+    ax.plot(years, areas, marker="o", color="green", label="Area (km²)")
+    ax.set_title("Trend Analysis: Area over the Selected Years", fontsize=16)
+    ax.set_xlabel("Years", fontsize=14)
+    ax.set_ylabel("Area (km²)", fontsize=14)
+    ax.tick_params(labelsize=12)
+    ax.grid(True)
+    ax.legend(fontsize=12)
+
+    fig.text(0.5, -0.1, "This line chart shows how the area coverage changed over the selected years.",
+             wrap=True, horizontalalignment='center', fontsize=12)
+
+    # Save the chart to a base64 string
+    return figure_to_base64(fig, bbox_inches="tight")
@@ -0,0 +1,57 @@
+import os
+import glob
+import time
+import logging
+import importlib
+
+# Modules the first /chat request would otherwise import
+WARMUP_MODULES = [
+    "utils.analysis",
+    "utils.visualization",
+    "utils.tiles",
+    "openai",
+    "folium",
+    "matplotlib.figure",
+    "matplotlib.colors",
+    "matplotlib.patches",
+    "matplotlib.backends.backend_agg",
+]
+
+
+def warm_up(data_dir, build_indexes=True):
+    """
+    Import the analysis and rendering stack and prime the persistent indexes.
+
+    Meant to run once in the Gunicorn master with preload_app, so forked
+    workers share the loaded modules and start serving immediately. It does
+    not start the worker pool or open network clients, as threads and
+    sockets do not survive a fork.
+
+    Args:
+        data_dir (str): Path to the directory containing raster files.
+        build_indexes (bool): Load (building if needed) the class stats of every raster
+            and the trajectory cube.
+
+    Returns:
+        float: Seconds spent warming up.
+    """
+    start = time.perf_counter()
+    for module in WARMUP_MODULES:
+        importlib.import_module(module)
+
+    # The first chart loads fonts and the Agg canvas
+    from utils.rendering import new_figure, figure_to_base64
+    figure_to_base64(new_figure((1, 1)))
+
+    if build_indexes:
+        from utils.class_index import get_class_stats
+        from utils.trajectory import get_trajectory_cube
+        file_paths = sorted(glob.glob(os.path.join(data_dir, "LC_Type1_*.tif")))
+        for file_path in file_paths:
+            get_class_stats(file_path)
+        if len(file_paths) >= 2:
+            get_trajectory_cube(data_dir)
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Warm-up finished in {elapsed:.2f}s")
+    return elapsed
@@ -0,0 +1,266 @@
+import os
+import math
+import json
+import glob
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils.global_config import ZONAL_MASK_CACHE_MAX_BYTES
+from utils.cache_util import file_signature
+from utils import metrics
+
+# rasterio and pyproj are imported where they are used, so list_regions and
+# load_region stay cheap for the web app's startup path
+
+# Rows of a region mask rasterized at once
+CHUNK_ROWS = 512
+
+# Value written over the pixels outside a region before counting; not a class code
+OUTSIDE_VALUE = 0
+
+_lock = threading.Lock()
+_masks = OrderedDict()  # (region hash, grid key) -> (Window, bit-packed mask rows)
+_mask_bytes = 0
+_counts = OrderedDict()  # (region hash, file path, file signature) -> counts and areas
+MAX_CACHED_COUNTS = 1024
+
+
+def list_regions(data_dir):
+    """
+    List the named regions shipped as GeoJSON files in the data directory.
+
+    Args:
+        data_dir (str): Path to the data directory.
+
+    Returns:
+        list: Region names (file names without the .geojson extension).
+    """
+    return sorted(
+        os.path.splitext(os.path.basename(path))[0]
+        for path in glob.glob(os.path.join(data_dir, "*.geojson"))
+    )
+
+
+def load_region(region, data_dir):
+    """
+    Resolve a region given by name or as GeoJSON into its geometries.
+
+    Args:
+        region (str or dict): Name of a .geojson file in data_dir, or a GeoJSON
+            FeatureCollection, Feature or Polygon/MultiPolygon geometry in EPSG:4326.
+        data_dir (str): Path to the data directory.
+
+    Returns:
+        dict: {"name": str, "key": str hash of the geometries, "geometries": [GeoJSON geometry],
+               "custom": True for regions given as GeoJSON rather than by name}.
+
+    Raises:
+        ValueError: If the name is unknown or the GeoJSON holds no valid polygon.
+    """
+    if isinstance(region, str):
+        if region not in list_regions(data_dir):
+            raise ValueError(f"Invalid region: {region}")
+        with open(os.path.join(data_dir, f"{region}.geojson"), "r", encoding="utf-8") as f:
+            geojson = json.load(f)
+        name = region
+    elif isinstance(region, dict):
+        geojson = region
+        name = "custom region"
+    else:
+        raise ValueError("A region must be a name or a GeoJSON object.")
+
+    if geojson.get("type") == "FeatureCollection":
+        features = geojson.get("features")
+        if not isinstance(features, list):
+            raise ValueError("Invalid GeoJSON FeatureCollection.")
+        geometries = [feature.get("geometry") if isinstance(feature, dict) else None for feature in features]
+    elif geojson.get("type") == "Feature":
+        geometries = [geojson.get("geometry")]
+    else:
+        geometries = [geojson]
+    if not geometries or not all(_is_polygon(geometry) for geometry in geometries):
+        raise ValueError("A region must consist of GeoJSON Polygon or MultiPolygon geometries.")
+
+    key = hashlib.sha1(json.dumps(geometries, sort_keys=True).encode("utf-8")).hexdigest()
+    return {"name": name, "key": key, "geometries": geometries, "custom": name == "custom region"}
+
+
+def region_overlaps(region, file_path):
+    """
+    Tell whether any pixel of a raster lies inside a region.
+
+    Args:
+        region (dict): Output of load_region.
+        file_path (str): Path to the raster file.
+
+    Returns:
+        bool: True if the region covers at least one pixel centre of the raster.
+    """
+    import rasterio
+
+    with rasterio.open(file_path) as src:
+        _, mask = get_region_mask(region, src.transform, src.crs, (src.height, src.width))
+    return bool(mask.any())
+
+
+def get_region_mask(region, transform, crs, shape):
+    """
+    Rasterize a region onto a raster grid, restricted to its bounding window.
+
+    The mask is computed once per (region, grid) pair and reused for every
+    year and class that share the grid. Cached masks are bit-packed, and the
+    cache is bounded by ZONAL_MASK_CACHE_MAX_BYTES.
+
+    Args:
+        region (dict): Output of load_region.
+        transform (Affine): Transform of the raster grid.
+        crs (CRS): CRS of the raster grid.
+        shape (tuple): (height, width) of the raster grid.
+
+    Returns:
+        tuple: (Window of the region's bounding box, bool mask of that window,
+                True inside the region). The window is empty when the region
+                does not overlap the grid.
+    """
+    global _mask_bytes
+    grid_key = (tuple(transform)[:6], crs.to_wkt(), tuple(shape))
+    key = (region["key"], grid_key)
+    with _lock:
+        cached = _masks.get(key)
+        if cached is not None:
+            _masks.move_to_end(key)
+    if cached is not None:
+        window, packed = cached
+        return window, np.unpackbits(packed, axis=1, count=int(window.width)).view(bool)
+
+    import rasterio.windows
+    from rasterio.features import geometry_mask
+    from rasterio.warp import transform_geom
+    from rasterio.windows import Window, from_bounds
+
+    geometries = [transform_geom("EPSG:4326", crs, geometry) for geometry in region["geometries"]]
+    xs, ys = [], []
+    for geometry in geometries:
+        coords = np.array(list(_iter_coords(geometry["coordinates"])))
+        xs.extend([coords[:, 0].min(), coords[:, 0].max()])
+        ys.extend([coords[:, 1].min(), coords[:, 1].max()])
+
+    # Grow the fractional bounding window outwards to whole pixels, then clip to the grid
+    bounds = from_bounds(min(xs), min(ys), max(xs), max(ys), transform)
+    col_start = max(0, math.floor(bounds.col_off))
+    row_start = max(0, math.floor(bounds.row_off))
+    col_stop = min(shape[1], math.ceil(bounds.col_off + bounds.width))
+    row_stop = min(shape[0], math.ceil(bounds.row_off + bounds.height))
+    window = Window(col_start, row_start, max(0, col_stop - col_start), max(0, row_stop - row_start))
+
+    height, width = int(window.height), int(window.width)
+    if height and width:
+        # Rasterize in strips; a single call over a large window peaks at many bytes per pixel
+        mask = np.empty((height, width), dtype=bool)
+        for row in range(0, height, CHUNK_ROWS):
+            rows = min(CHUNK_ROWS, height - row)
+            strip = Window(window.col_off, window.row_off + row, width, rows)
+            mask[row:row + rows] = geometry_mask(
+                geometries,
+                out_shape=(rows, width),
+                transform=rasterio.windows.transform(strip, transform),
+                invert=True,
+            )
+    else:
+        mask = np.zeros((0, 0), dtype=bool)
+
+    packed = np.packbits(mask, axis=1)
+    with _lock:
+        if key not in _masks and packed.nbytes <= ZONAL_MASK_CACHE_MAX_BYTES:
+            _masks[key] = (window, packed)
+            _mask_bytes += packed.nbytes
+            while _mask_bytes > ZONAL_MASK_CACHE_MAX_BYTES:
+                _mask_bytes -= _masks.popitem(last=False)[1][1].nbytes
+    return window, mask
+
+
+def compute_zonal_stats(file_path, region):
+    """
+    Count the pixels and ground area of every class inside a region.
+
+    Only the region's bounding window of the raster is read.
+
+    Args:
+        file_path (str): Path to the raster file.
+        region (dict): Output of load_region.
+
+    Returns:
+        dict: {"counts": int64 histogram of length 256, "areas": float64 km² of length 256},
+              both indexed by class code.
+    """
+    key = (region["key"], os.path.abspath(file_path), file_signature(file_path))
+    with _lock:
+        cached = _counts.get(key)
+    if cached is not None:
+        return cached
+
+    import rasterio
+    from utils.pixel_area import get_row_areas, class_counts_and_areas
+
+    with rasterio.open(file_path) as src:
+        window, mask = get_region_mask(region, src.transform, src.crs, (src.height, src.width))
+        if mask.size:
+            row_areas = get_row_areas(src.transform, src.crs, src.height, src.width)
+            window_row_areas = row_areas[window.row_off:window.row_off + window.height]
+            values = src.read(1, window=window)
+            metrics.increment("raster_bytes_read_total", values.nbytes, read="window")
+            # Count the window in place with the pixels outside the region set to
+            # OUTSIDE_VALUE, then take those pixels back out of that class
+            outside = ~mask
+            values[outside] = OUTSIDE_VALUE
+            counts, areas = class_counts_and_areas(values, window_row_areas)
+            outside_per_row = outside.sum(axis=1)
+            counts[OUTSIDE_VALUE] -= outside_per_row.sum()
+            areas[OUTSIDE_VALUE] -= outside_per_row @ window_row_areas
+            stats = {"counts": counts, "areas": areas}
+        else:
+            stats = {"counts": np.zeros(256, dtype=np.int64), "areas": np.zeros(256, dtype=np.float64)}
+
+    with _lock:
+        _counts[key] = stats
+        while len(_counts) > MAX_CACHED_COUNTS:
+            _counts.popitem(last=False)
+    return stats
+
+
+def _is_polygon(geometry):
+    """Check that a GeoJSON geometry is a Polygon or MultiPolygon of closed rings of lon/lat positions."""
+    if not isinstance(geometry, dict):
+        return False
+    coordinates = geometry.get("coordinates")
+    if geometry.get("type") == "Polygon":
+        polygons = [coordinates]
+    elif geometry.get("type") == "MultiPolygon" and isinstance(coordinates, list):
+        polygons = coordinates
+    else:
+        return False
+    if not polygons:
+        return False
+    for rings in polygons:
+        if not isinstance(rings, list) or not rings:
+            return False
+        for ring in rings:
+            if not isinstance(ring, list) or len(ring) < 4 or ring[0] != ring[-1]:
+                return False
+            for position in ring:
+                if (not isinstance(position, list) or len(position) < 2
+                        or not all(isinstance(value, (int, float)) and not isinstance(value, bool)
+                                   for value in position[:2])
+                        or not (-180 <= position[0] <= 180 and -90 <= position[1] <= 90)):
+                    return False
+    return True
+
+
+def _iter_coords(coordinates):
+    """Yield the (x, y) positions of arbitrarily nested GeoJSON coordinates."""
+    if isinstance(coordinates[0], (int, float)):
+        yield coordinates[:2]
+        return
+    for part in coordinates:
+        yield from _iter_coords(part)